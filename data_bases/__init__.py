@@ -1 +1,6 @@
+from .base_db import ConnectionPool
+from .economy_db import EconomyDB
 from .payment_db import Payment, PaymentServiceDB, Service, ServiceSnapshot
+from .tax_queue_db import TaxJob, TaxQueueDB
+from .vanity_db import VanityCacheDB
+from .workshop_db import WorkshopCacheDB, WorkshopItem
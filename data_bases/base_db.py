@@ -1,24 +1,129 @@
 import sqlite3
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
+from queue import Empty, Full, Queue
 from threading import Lock
 
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8192",  # 8 MiB
+    "PRAGMA mmap_size=67108864",  # 64 MiB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+class ConnectionPool:
+    """Shared reusable sqlite connections, checked out per use.
+
+    Each database file keeps at most MAX_IDLE idle connections. A checkout
+    never waits: when none is idle a new one is opened, and connections
+    returned to a full pool are closed, so short-lived worker threads
+    cannot accumulate open handles.
+    """
+
+    MAX_IDLE = 8
+
+    _idle: dict[str, Queue[sqlite3.Connection]] = {}
+    _lock = Lock()
+
+    @classmethod
+    def _queue(cls, key: str) -> Queue[sqlite3.Connection]:
+        with cls._lock:
+            q = cls._idle.get(key)
+            if q is None:
+                q = cls._idle[key] = Queue(maxsize=cls.MAX_IDLE)
+
+            return q
+
+    @classmethod
+    def get(cls, path: Path) -> sqlite3.Connection:
+        key = str(path)
+        try:
+            return cls._queue(key).get_nowait()
+
+        except Empty:
+            pass
+
+        conn = sqlite3.connect(key, timeout=30, check_same_thread=False)
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+
+        return conn
+
+    @classmethod
+    def put(cls, path: Path, conn: sqlite3.Connection) -> None:
+        try:
+            cls._queue(str(path)).put_nowait(conn)
+
+        except Full:
+            conn.close()
+
+    @classmethod
+    def close_all(cls) -> None:
+        with cls._lock:
+            queues = list(cls._idle.values())
+            cls._idle.clear()
+
+        for q in queues:
+            while True:
+                try:
+                    conn = q.get_nowait()
+
+                except Empty:
+                    break
+
+                try:
+                    conn.close()
+
+                except sqlite3.Error:
+                    pass
+
 
 class BaseDB:
+    _db_dir: str = "data/dbs"
     _db_name: str = ""
-    _lock = Lock()
+
+    # Writers are serialized per database file, readers never lock (WAL)
+    _write_locks: dict[str, Lock] = {}
+    _write_locks_guard = Lock()
+
+    @classmethod
+    def _db_path(cls) -> Path:
+        return Path(cls._db_dir) / (cls._db_name + ".db")
+
+    @classmethod
+    def _write_lock(cls) -> Lock:
+        key = str(cls._db_path())
+        with cls._write_locks_guard:
+            lock = cls._write_locks.get(key)
+            if lock is None:
+                lock = cls._write_locks[key] = Lock()
+
+            return lock
 
     @classmethod
     @contextmanager
-    def _connect(cls):
-        with cls._lock:
-            conn = sqlite3.connect(Path("data/dbs") / (cls._db_name + ".db"))
+    def _connect(cls, write: bool = False):
+        with cls._write_lock() if write else nullcontext():
+            path = cls._db_path()
+            conn = ConnectionPool.get(path)
             try:
                 yield conn
 
             finally:
-                conn.close()
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+
+                except sqlite3.Error:
+                    conn.close()
+
+                else:
+                    ConnectionPool.put(path, conn)
 
     @classmethod
     def create_db_table(cls) -> None:
-        Path("data/dbs").mkdir(parents=True, exist_ok=True)
+        Path(cls._db_dir).mkdir(parents=True, exist_ok=True)
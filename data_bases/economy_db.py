@@ -0,0 +1,99 @@
+from .base_db import BaseDB
+
+
+class EconomyDB(BaseDB):
+    """Item totals per economy snapshot, as (item_id, ts, count) points."""
+
+    _db_name = "Economy"
+
+    @classmethod
+    def create_db_table(cls) -> None:
+        super().create_db_table()
+        with cls._connect(write=True) as con:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS economy_snapshot (
+                    ts INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                );
+                CREATE TABLE IF NOT EXISTS economy_item (
+                    item_id TEXT PRIMARY KEY
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS economy_point (
+                    item_id TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (item_id, ts)
+                ) WITHOUT ROWID;
+            """)
+            con.commit()
+
+    @classmethod
+    def add_snapshot(cls, ts: int, name: str, items: list[dict]) -> bool:
+        """Store one snapshot's totals; False if it was already stored."""
+        points = [(it["id"], ts, int(it["count"])) for it in items if it.get("id")]
+        with cls._connect(write=True) as con:
+            cur = con.execute(
+                "INSERT OR IGNORE INTO economy_snapshot (ts, name) VALUES (?, ?)",
+                (ts, name),
+            )
+            if cur.rowcount == 0:
+                return False
+
+            con.executemany(
+                "INSERT OR IGNORE INTO economy_item (item_id) VALUES (?)",
+                [(p[0],) for p in points],
+            )
+            con.executemany(
+                "INSERT OR REPLACE INTO economy_point (item_id, ts, count)"
+                " VALUES (?, ?, ?)",
+                points,
+            )
+            con.commit()
+
+        return True
+
+    @classmethod
+    def snapshot_names(cls) -> set[str]:
+        with cls._connect() as con:
+            return {r[0] for r in con.execute("SELECT name FROM economy_snapshot")}
+
+    @classmethod
+    def item_ids(cls, prefixes: tuple[str, ...] = ()) -> list[str]:
+        """Known item ids, optionally only those starting with a prefix."""
+        with cls._connect() as con:
+            if not prefixes:
+                rows = con.execute(
+                    "SELECT item_id FROM economy_item ORDER BY item_id"
+                ).fetchall()
+                return [r[0] for r in rows]
+
+            out: list[str] = []
+            for prefix in prefixes:
+                # Range on the primary key instead of LIKE, so the index is used
+                upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                rows = con.execute(
+                    "SELECT item_id FROM economy_item"
+                    " WHERE item_id >= ? AND item_id < ? ORDER BY item_id",
+                    (prefix, upper),
+                ).fetchall()
+                out.extend(r[0] for r in rows)
+
+            return out
+
+    @classmethod
+    def series(
+        cls, item_ids: list[str], since: int, until: int
+    ) -> dict[str, list[tuple[int, int]]]:
+        """(ts, count) points of the given items within [since, until]."""
+        out: dict[str, list[tuple[int, int]]] = {}
+        with cls._connect() as con:
+            for item_id in item_ids:
+                rows = con.execute(
+                    "SELECT ts, count FROM economy_point"
+                    " WHERE item_id = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                    (item_id, since, until),
+                ).fetchall()
+                if rows:
+                    out[item_id] = [(ts, cnt) for ts, cnt in rows]
+
+        return out
@@ -1,4 +1,5 @@
 import json
+import logging
 from dataclasses import dataclass
 from datetime import UTC, datetime
 from decimal import ROUND_HALF_UP, Decimal
@@ -6,6 +7,8 @@ from typing import Literal
 
 from .base_db import BaseDB
 
+logger = logging.getLogger(__name__)
+
 TWOPLACES = Decimal("0.01")
 
 
@@ -177,6 +180,8 @@ class Payment:
     received_amount: Decimal | None = None
     payer_amount: Decimal | None = None
 
+    created_at: datetime | None = None
+
     def to_fns_struct(self) -> list[tuple[str, Decimal]]:
         return [
             (
@@ -214,6 +219,7 @@ class Payment:
             "tax_check_id": self.tax_check_id,
             "received_amount": _dec_to_str_opt(self.received_amount),
             "payer_amount": _dec_to_str_opt(self.payer_amount),
+            "created_at": _dt_to_iso(self.created_at),
         }
 
     @classmethod
@@ -226,32 +232,154 @@ class Payment:
             tax_check_id=d.get("tax_check_id"),
             received_amount=_dec_from_str_opt(d.get("received_amount")),
             payer_amount=_dec_from_str_opt(d.get("payer_amount")),
+            created_at=_dt_from_iso(d.get("created_at")),
         )
 
 
 class PaymentServiceDB(BaseDB):
     _db_name = "PaymentService"
 
+    _PAYMENT_COLS = (
+        "status, player_id, commission_key, tax_check_id, "
+        "received_amount, payer_amount, created_at"
+    )
+    _SNAPSHOT_COLS = "name, creation_date, price_main, discount_value, service_u_id"
+
+    _SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS service (
+            u_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS payment (
+            id INTEGER PRIMARY KEY,
+            u_id TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL,
+            player_id TEXT NOT NULL,
+            commission_key TEXT NOT NULL DEFAULT 'AC',
+            tax_check_id TEXT,
+            received_amount TEXT,
+            payer_amount TEXT,
+            total TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS payment_snapshot (
+            payment_id INTEGER NOT NULL
+                REFERENCES payment(id) ON DELETE CASCADE,
+            pos INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            creation_date TEXT NOT NULL,
+            price_main TEXT NOT NULL,
+            discount_value INTEGER NOT NULL DEFAULT 0,
+            service_u_id TEXT,
+            PRIMARY KEY (payment_id, pos)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS payment_created_idx
+            ON payment (created_at, id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS payment_status_created_idx
+            ON payment (status, created_at, id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS payment_player_created_idx
+            ON payment (player_id, created_at, id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS payment_no_tax_check_idx
+            ON payment (status, created_at, id) WHERE tax_check_id IS NULL
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS payment_snapshot_service_idx
+            ON payment_snapshot (service_u_id)
+        """,
+    )
+
     @classmethod
     def create_db_table(cls) -> None:
         super().create_db_table()
-        with cls._connect() as con:
-            con.executescript("""
-                CREATE TABLE IF NOT EXISTS service (
-                    u_id TEXT PRIMARY KEY,
-                    data TEXT NOT NULL
-                );
-                CREATE TABLE IF NOT EXISTS payment (
-                    u_id TEXT PRIMARY KEY,
-                    data TEXT NOT NULL
-                );
-            """)
+        with cls._connect(write=True) as con:
+            # One explicit transaction: DDL would otherwise autocommit and a
+            # failed copy would leave the legacy rows behind an empty table
+            con.execute("BEGIN")
+            if cls._is_legacy_payment_table(con):
+                con.execute("ALTER TABLE payment RENAME TO payment_legacy")
+
+            for stmt in cls._SCHEMA:
+                con.execute(stmt)
+
+            if cls._has_table(con, "payment_legacy"):
+                cls._migrate_legacy_payments(con)
+
             con.commit()
 
+    @staticmethod
+    def _is_legacy_payment_table(con) -> bool:
+        cols = {row[1] for row in con.execute("PRAGMA table_info(payment)")}
+        return "data" in cols
+
+    @staticmethod
+    def _has_table(con, name: str) -> bool:
+        row = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)
+        ).fetchone()
+        return row is not None
+
+    @classmethod
+    def _migrate_legacy_payments(cls, con) -> None:
+        # Legacy rows carry no creation time: keep their insertion order
+        # (rowid) and stamp them with the migration time. Copied rows are
+        # removed, so an interrupted migration resumes on the next start and
+        # rows that cannot be parsed stay in payment_legacy.
+        migrated_at = datetime.now(UTC)
+        copied: list[tuple[int]] = []
+        skipped = 0
+        last = 0
+        # Batches by rowid: a savepoint rollback aborts any open read cursor
+        while rows := con.execute(
+            "SELECT rowid, u_id, data FROM payment_legacy"
+            " WHERE rowid > ? ORDER BY rowid LIMIT 500",
+            (last,),
+        ).fetchall():
+            last = rows[-1][0]
+            for rowid, u_id, data in rows:
+                con.execute("SAVEPOINT legacy_row")
+                try:
+                    payment = Payment.from_dict(json.loads(data))
+                    payment.created_at = payment.created_at or migrated_at
+                    cls._write_payment(con, u_id, payment)
+
+                except Exception as e:
+                    con.execute("ROLLBACK TO legacy_row")
+                    logger.warning("Skipping legacy payment %s: %s", u_id, e)
+                    skipped += 1
+
+                else:
+                    copied.append((rowid,))
+
+                finally:
+                    con.execute("RELEASE legacy_row")
+
+        con.executemany("DELETE FROM payment_legacy WHERE rowid=?", copied)
+        if skipped:
+            logger.warning(
+                "%s legacy payments left in payment_legacy, migrated %s",
+                skipped,
+                len(copied),
+            )
+        else:
+            con.execute("DROP TABLE payment_legacy")
+
     @classmethod
     def upsert_service(cls, u_id: str, service: Service) -> None:
         payload = json.dumps(service.to_dict(), ensure_ascii=False)
-        with cls._connect() as con:
+        with cls._connect(write=True) as con:
             con.execute(
                 """
                 INSERT INTO service (u_id, data) VALUES (?, ?)
@@ -282,81 +410,288 @@ class PaymentServiceDB(BaseDB):
 
     @classmethod
     def delete_service(cls, u_id: str) -> bool:
-        with cls._connect() as con:
+        with cls._connect(write=True) as con:
             cur = con.execute("DELETE FROM service WHERE u_id=?", (u_id,))
             con.commit()
             return cur.rowcount > 0
 
-    @classmethod
-    def decrement_service_left(cls, service_u_id: str, qty: int = 1) -> bool:
-        if qty <= 0:
-            return True
-
-        svc = cls.get_service(service_u_id)
-        if not svc:
-            return False
-
-        if svc.left is None:
-            return True
+    # Stock lives in the service JSON; `left` = null means unlimited, and
+    # NULL arithmetic keeps it null.
+    _RESERVE_SQL = """
+        UPDATE service
+        SET data = json_set(data, '$.left', json_extract(data, '$.left') - ?)
+        WHERE u_id = ?
+          AND json_extract(data, '$.status') = 'on'
+          AND (json_extract(data, '$.left') IS NULL
+               OR json_extract(data, '$.left') >= ?)
+    """
+    _RELEASE_SQL = """
+        UPDATE service
+        SET data = json_set(data, '$.left', json_extract(data, '$.left') + ?)
+        WHERE u_id = ?
+    """
 
-        if svc.left < qty:
-            return False
+    @classmethod
+    def reserve_services(
+        cls, want: dict[str, int]
+    ) -> tuple[dict[str, Service], dict[str, str]]:
+        """Decrement stock for every item in one transaction, all or nothing.
+
+        Returns the reserved services and, on failure, a reason per failed
+        service id ("not_found", "inactive" or "out_of_stock"); nothing is
+        decremented when any item fails.
+        """
+        failed: dict[str, str] = {}
+        with cls._connect(write=True) as con:
+            for svc_id, qty in want.items():
+                cur = con.execute(cls._RESERVE_SQL, (qty, svc_id, qty))
+                if cur.rowcount > 0:
+                    continue
+
+                row = con.execute(
+                    "SELECT json_extract(data, '$.status') FROM service WHERE u_id=?",
+                    (svc_id,),
+                ).fetchone()
+                if not row:
+                    failed[svc_id] = "not_found"
+
+                elif row[0] != "on":
+                    failed[svc_id] = "inactive"
+
+                else:
+                    failed[svc_id] = "out_of_stock"
+
+            if failed:
+                con.rollback()
+                return {}, failed
+
+            marks = ", ".join("?" for _ in want)
+            rows = con.execute(
+                f"SELECT u_id, data FROM service WHERE u_id IN ({marks})",
+                list(want),
+            ).fetchall()
+            con.commit()
 
-        svc.left -= qty
-        cls.upsert_service(service_u_id, svc)
-        return True
+        return {u: Service.from_dict(json.loads(j)) for (u, j) in rows}, {}
 
     @classmethod
-    def increment_service_left(cls, service_u_id: str, qty: int = 1) -> bool:
-        if qty <= 0:
-            return True
+    def release_services(cls, counts: dict[str, int]) -> None:
+        counts = {u: q for u, q in counts.items() if q > 0}
+        if not counts:
+            return
+
+        with cls._connect(write=True) as con:
+            con.executemany(
+                cls._RELEASE_SQL, [(qty, svc_id) for svc_id, qty in counts.items()]
+            )
+            con.commit()
 
-        svc = cls.get_service(service_u_id)
-        if not svc:
-            return False
+    @staticmethod
+    def _write_payment(con, u_id: str, payment: Payment) -> None:
+        # tax_check_id is set concurrently by the AutoTax worker, so a stale
+        # Payment without one must not clear it.
+        if payment.created_at is None:
+            payment.created_at = datetime.now(UTC)
+
+        payment_id = con.execute(
+            """
+            INSERT INTO payment (
+                u_id, status, player_id, commission_key, tax_check_id,
+                received_amount, payer_amount, total, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(u_id) DO UPDATE SET
+                status=excluded.status,
+                player_id=excluded.player_id,
+                commission_key=excluded.commission_key,
+                tax_check_id=COALESCE(excluded.tax_check_id, payment.tax_check_id),
+                received_amount=excluded.received_amount,
+                payer_amount=excluded.payer_amount,
+                total=excluded.total
+            RETURNING id
+        """,
+            (
+                u_id,
+                payment.status,
+                payment.player_id,
+                payment.commission_key,
+                payment.tax_check_id,
+                _dec_to_str_opt(payment.received_amount),
+                _dec_to_str_opt(payment.payer_amount),
+                _dec_to_str(payment.total()),
+                _dt_to_iso(payment.created_at),
+            ),
+        ).fetchone()[0]
+
+        con.execute("DELETE FROM payment_snapshot WHERE payment_id=?", (payment_id,))
+        con.executemany(
+            """
+            INSERT INTO payment_snapshot (
+                payment_id, pos, name, creation_date, price_main,
+                discount_value, service_u_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+            [
+                (
+                    payment_id,
+                    pos,
+                    snap.name,
+                    _dt_to_iso(snap.creation_date),
+                    _dec_to_str(snap.price_main),
+                    int(_clamp_discount(snap.discount_value)),
+                    snap.service_u_id,
+                )
+                for pos, snap in enumerate(payment.snapshot)
+            ],
+        )
 
-        if svc.left is None:
-            return True
+    @staticmethod
+    def _payment_from_row(row: tuple, snapshot: list[ServiceSnapshot]) -> Payment:
+        (
+            status,
+            player_id,
+            commission_key,
+            tax_check_id,
+            received_amount,
+            payer_amount,
+            created_at,
+        ) = row
+        return Payment(
+            status=status,
+            player_id=player_id,
+            snapshot=snapshot,
+            commission_key=commission_key,
+            tax_check_id=tax_check_id,
+            received_amount=_dec_from_str_opt(received_amount),
+            payer_amount=_dec_from_str_opt(payer_amount),
+            created_at=_dt_from_iso(created_at),
+        )
 
-        svc.left += qty
-        cls.upsert_service(service_u_id, svc)
-        return True
+    @staticmethod
+    def _snapshot_from_row(row: tuple) -> ServiceSnapshot:
+        name, creation_date, price_main, discount_value, service_u_id = row
+        return ServiceSnapshot(
+            name=name,
+            creation_date=_dt_from_iso(creation_date),  # type: ignore
+            price_main=_dec_from_str(price_main),
+            discount_value=int(discount_value),
+            service_u_id=service_u_id,
+        )
 
     @classmethod
     def upsert_payment(cls, u_id: str, payment: Payment) -> None:
-        payload = json.dumps(payment.to_dict(), ensure_ascii=False)
-        with cls._connect() as con:
-            con.execute(
-                """
-                INSERT INTO payment (u_id, data) VALUES (?, ?)
-                ON CONFLICT(u_id) DO UPDATE SET data=excluded.data
-            """,
-                (u_id, payload),
-            )
+        with cls._connect(write=True) as con:
+            cls._write_payment(con, u_id, payment)
             con.commit()
 
     @classmethod
     def get_payment(cls, u_id: str) -> Payment | None:
         with cls._connect() as con:
-            cur = con.execute("SELECT data FROM payment WHERE u_id=?", (u_id,))
-            row = cur.fetchone()
+            row = con.execute(
+                f"SELECT id, {cls._PAYMENT_COLS} FROM payment WHERE u_id=?", (u_id,)
+            ).fetchone()
+            if not row:
+                return None
+
+            snaps = con.execute(
+                f"SELECT {cls._SNAPSHOT_COLS} FROM payment_snapshot "
+                "WHERE payment_id=? ORDER BY pos",
+                (row[0],),
+            ).fetchall()
+
+        return cls._payment_from_row(
+            row[1:], [cls._snapshot_from_row(s) for s in snaps]
+        )
 
-        if not row:
-            return None
+    @classmethod
+    def get_payment_tax_state(cls, u_id: str) -> tuple[str, str | None] | None:
+        """(status, tax_check_id) without loading the snapshot."""
+        with cls._connect() as con:
+            row = con.execute(
+                "SELECT status, tax_check_id FROM payment WHERE u_id=?", (u_id,)
+            ).fetchone()
 
-        return Payment.from_dict(json.loads(row[0]))
+        return (row[0], row[1]) if row else None
 
     @classmethod
-    def list_payments(cls) -> list[tuple[str, Payment]]:
-        with cls._connect() as con:
-            cur = con.execute("SELECT u_id, data FROM payment")
-            rows = cur.fetchall()
+    def set_tax_check_id(cls, u_id: str, tax_check_id: str | None) -> bool:
+        with cls._connect(write=True) as con:
+            cur = con.execute(
+                "UPDATE payment SET tax_check_id=? WHERE u_id=?", (tax_check_id, u_id)
+            )
+            con.commit()
+            return cur.rowcount > 0
 
-        return [(u, Payment.from_dict(json.loads(j))) for (u, j) in rows]
+    @classmethod
+    def list_payments_page(
+        cls,
+        limit: int,
+        before: tuple[str, int] | None = None,
+        status: str | None = None,
+        player_id: str | None = None,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        missing_tax_check: bool = False,
+    ) -> tuple[list[tuple[str, Payment]], tuple[str, int] | None]:
+        """Newest-first keyset page; returns rows and the cursor for the next page."""
+        where, params = [], []
+        if before is not None:
+            where.append("(created_at, id) < (?, ?)")
+            params.extend(before)
+
+        if status:
+            where.append("status = ?")
+            params.append(status)
+
+        if player_id:
+            where.append("player_id = ?")
+            params.append(player_id)
+
+        if created_from is not None:
+            where.append("created_at >= ?")
+            params.append(_dt_to_iso(created_from))
+
+        if created_to is not None:
+            where.append("created_at < ?")
+            params.append(_dt_to_iso(created_to))
+
+        if missing_tax_check:
+            where.append("tax_check_id IS NULL")
+
+        sql = f"SELECT id, u_id, {cls._PAYMENT_COLS} FROM payment"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with cls._connect() as con:
+            rows = con.execute(sql, params).fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+
+            snaps: dict[int, list[ServiceSnapshot]] = {}
+            if rows:
+                marks = ", ".join("?" for _ in rows)
+                snap_rows = con.execute(
+                    f"SELECT payment_id, {cls._SNAPSHOT_COLS} FROM payment_snapshot "
+                    f"WHERE payment_id IN ({marks}) ORDER BY payment_id, pos",
+                    [r[0] for r in rows],
+                ).fetchall()
+                for sr in snap_rows:
+                    snaps.setdefault(sr[0], []).append(cls._snapshot_from_row(sr[1:]))
+
+        page = [(r[1], cls._payment_from_row(r[2:], snaps.get(r[0], []))) for r in rows]
+        next_cursor = (rows[-1][-1], rows[-1][0]) if has_more else None
+        return page, next_cursor
 
     @classmethod
     def delete_payment(cls, u_id: str) -> bool:
-        with cls._connect() as con:
+        with cls._connect(write=True) as con:
+            con.execute(
+                "DELETE FROM payment_snapshot WHERE payment_id IN "
+                "(SELECT id FROM payment WHERE u_id=?)",
+                (u_id,),
+            )
             cur = con.execute("DELETE FROM payment WHERE u_id=?", (u_id,))
             con.commit()
             return cur.rowcount > 0
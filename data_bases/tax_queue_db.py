@@ -0,0 +1,181 @@
+import json
+import time
+from dataclasses import dataclass
+
+from .base_db import BaseDB
+
+
+@dataclass
+class TaxJob:
+    payment_id: str
+    services: list[tuple[str, str]]  # (name, amount as "0.00")
+    attempts: int
+    last_error: str | None
+    next_try_ts: float
+
+
+class TaxQueueDB(BaseDB):
+    _db_name = "TaxQueue"
+
+    _JOB_COLS = "payment_id, services, attempts, last_error, next_try_ts"
+
+    @classmethod
+    def create_db_table(cls) -> None:
+        super().create_db_table()
+        with cls._connect(write=True) as con:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS tax_job (
+                    payment_id TEXT PRIMARY KEY,
+                    services TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    next_try_ts REAL NOT NULL,
+                    created_ts REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS tax_job_next_try_idx
+                    ON tax_job (next_try_ts);
+            """)
+            con.commit()
+
+    @staticmethod
+    def _job_from_row(row: tuple) -> TaxJob:
+        payment_id, services, attempts, last_error, next_try_ts = row
+        return TaxJob(
+            payment_id=payment_id,
+            services=[(name, amount) for name, amount in json.loads(services)],
+            attempts=int(attempts),
+            last_error=last_error,
+            next_try_ts=float(next_try_ts),
+        )
+
+    @classmethod
+    def enqueue(
+        cls,
+        payment_id: str,
+        services: list[tuple[str, str]],
+        next_try_ts: float | None = None,
+    ) -> None:
+        """Add a job or make an existing one due now, keeping its attempts."""
+        now = time.time()
+        with cls._connect(write=True) as con:
+            con.execute(
+                """
+                INSERT INTO tax_job (
+                    payment_id, services, attempts, last_error, next_try_ts,
+                    created_ts
+                ) VALUES (?, ?, 0, NULL, ?, ?)
+                ON CONFLICT(payment_id) DO UPDATE SET
+                    services=excluded.services,
+                    last_error=NULL,
+                    next_try_ts=excluded.next_try_ts
+            """,
+                (
+                    payment_id,
+                    json.dumps(services, ensure_ascii=False),
+                    now if next_try_ts is None else next_try_ts,
+                    now,
+                ),
+            )
+            con.commit()
+
+    @classmethod
+    def enqueue_many(cls, jobs: list[TaxJob]) -> None:
+        now = time.time()
+        with cls._connect(write=True) as con:
+            con.executemany(
+                """
+                INSERT INTO tax_job (
+                    payment_id, services, attempts, last_error, next_try_ts,
+                    created_ts
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(payment_id) DO NOTHING
+            """,
+                [
+                    (
+                        j.payment_id,
+                        json.dumps(j.services, ensure_ascii=False),
+                        j.attempts,
+                        j.last_error,
+                        j.next_try_ts,
+                        now,
+                    )
+                    for j in jobs
+                ],
+            )
+            con.commit()
+
+    @classmethod
+    def claim_due(cls, limit: int, lease_sec: float) -> list[TaxJob]:
+        """Lease up to `limit` due jobs by pushing their next_try_ts forward.
+
+        A claimed job is invisible to other workers until the lease runs out,
+        so a crashed worker's jobs come back on their own.
+        """
+        now = time.time()
+        with cls._connect(write=True) as con:
+            rows = con.execute(
+                f"""
+                UPDATE tax_job SET next_try_ts = ?
+                WHERE payment_id IN (
+                    SELECT payment_id FROM tax_job
+                    WHERE next_try_ts <= ?
+                    ORDER BY next_try_ts
+                    LIMIT ?
+                )
+                RETURNING {cls._JOB_COLS}
+            """,
+                (now + lease_sec, now, limit),
+            ).fetchall()
+            con.commit()
+
+        return [cls._job_from_row(r) for r in rows]
+
+    @classmethod
+    def ack(cls, payment_id: str) -> bool:
+        with cls._connect(write=True) as con:
+            cur = con.execute("DELETE FROM tax_job WHERE payment_id=?", (payment_id,))
+            con.commit()
+            return cur.rowcount > 0
+
+    @classmethod
+    def retry_later(cls, payment_id: str, error: str, next_try_ts: float) -> None:
+        with cls._connect(write=True) as con:
+            con.execute(
+                """
+                UPDATE tax_job
+                SET attempts = attempts + 1, last_error = ?, next_try_ts = ?
+                WHERE payment_id = ?
+            """,
+                (error[:500], next_try_ts, payment_id),
+            )
+            con.commit()
+
+    @classmethod
+    def stats(cls) -> dict:
+        now = time.time()
+        with cls._connect() as con:
+            depth, due, oldest, max_attempts = con.execute(
+                """
+                SELECT COUNT(*), COALESCE(SUM(next_try_ts <= ?), 0),
+                       MIN(created_ts), MAX(attempts)
+                FROM tax_job
+            """,
+                (now,),
+            ).fetchone()
+
+        return {
+            "depth": depth,
+            "due": due,
+            "oldest_age_sec": round(now - oldest, 1) if oldest else 0.0,
+            "max_attempts": max_attempts or 0,
+        }
+
+    @classmethod
+    def get_job(cls, payment_id: str) -> TaxJob | None:
+        with cls._connect() as con:
+            row = con.execute(
+                f"SELECT {cls._JOB_COLS} FROM tax_job WHERE payment_id=?",
+                (payment_id,),
+            ).fetchone()
+
+        return cls._job_from_row(row) if row else None
@@ -0,0 +1,48 @@
+import time
+
+from .base_db import BaseDB
+
+
+class VanityCacheDB(BaseDB):
+    """Steam vanity name -> SteamID64, with misses cached as NULL."""
+
+    _db_name = "SteamVanity"
+
+    @classmethod
+    def create_db_table(cls) -> None:
+        super().create_db_table()
+        with cls._connect(write=True) as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS steam_vanity (
+                    vanity TEXT PRIMARY KEY COLLATE NOCASE,
+                    steam_id TEXT,
+                    fetched_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            con.commit()
+
+    @classmethod
+    def get(cls, vanity: str) -> tuple[str | None, float] | None:
+        """(steam_id or None for a cached miss, fetched_at), None if unknown."""
+        with cls._connect() as con:
+            row = con.execute(
+                "SELECT steam_id, fetched_at FROM steam_vanity WHERE vanity = ?",
+                (vanity,),
+            ).fetchone()
+
+        return (row[0], float(row[1])) if row else None
+
+    @classmethod
+    def put(cls, vanity: str, steam_id: str | None) -> None:
+        with cls._connect(write=True) as con:
+            con.execute(
+                """
+                INSERT INTO steam_vanity (vanity, steam_id, fetched_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(vanity) DO UPDATE SET
+                    steam_id=excluded.steam_id,
+                    fetched_at=excluded.fetched_at
+            """,
+                (vanity, steam_id, time.time()),
+            )
+            con.commit()
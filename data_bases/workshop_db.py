@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+
+from .base_db import BaseDB
+
+
+@dataclass
+class WorkshopItem:
+    publishedfileid: str
+    file_size: int
+    title: str
+    time_updated: int
+    fetched_at: float
+
+
+class WorkshopCacheDB(BaseDB):
+    _db_name = "Workshop"
+
+    _ITEM_COLS = "publishedfileid, file_size, title, time_updated, fetched_at"
+
+    @classmethod
+    def create_db_table(cls) -> None:
+        super().create_db_table()
+        with cls._connect(write=True) as con:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS workshop_item (
+                    publishedfileid TEXT PRIMARY KEY,
+                    file_size INTEGER NOT NULL,
+                    title TEXT NOT NULL DEFAULT '',
+                    time_updated INTEGER NOT NULL DEFAULT 0,
+                    fetched_at REAL NOT NULL
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS workshop_item_fetched_idx
+                    ON workshop_item (fetched_at);
+            """)
+            con.commit()
+
+    @staticmethod
+    def _item_from_row(row: tuple) -> WorkshopItem:
+        fid, file_size, title, time_updated, fetched_at = row
+        return WorkshopItem(
+            publishedfileid=fid,
+            file_size=int(file_size),
+            title=title,
+            time_updated=int(time_updated),
+            fetched_at=float(fetched_at),
+        )
+
+    @classmethod
+    def get_many(cls, ids: list[str]) -> dict[str, WorkshopItem]:
+        result: dict[str, WorkshopItem] = {}
+        with cls._connect() as con:
+            # Stay well under SQLite's bound parameter limit
+            for i in range(0, len(ids), 500):
+                chunk = ids[i : i + 500]
+                marks = ", ".join("?" * len(chunk))
+                rows = con.execute(
+                    f"SELECT {cls._ITEM_COLS} FROM workshop_item"
+                    f" WHERE publishedfileid IN ({marks})",
+                    chunk,
+                ).fetchall()
+                for row in rows:
+                    item = cls._item_from_row(row)
+                    result[item.publishedfileid] = item
+
+        return result
+
+    @classmethod
+    def upsert_many(cls, items: list[WorkshopItem]) -> None:
+        if not items:
+            return
+
+        with cls._connect(write=True) as con:
+            con.executemany(
+                f"""
+                INSERT INTO workshop_item ({cls._ITEM_COLS})
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(publishedfileid) DO UPDATE SET
+                    file_size=excluded.file_size,
+                    title=excluded.title,
+                    time_updated=excluded.time_updated,
+                    fetched_at=excluded.fetched_at
+            """,
+                [
+                    (
+                        it.publishedfileid,
+                        it.file_size,
+                        it.title,
+                        it.time_updated,
+                        it.fetched_at,
+                    )
+                    for it in items
+                ],
+            )
+            con.commit()
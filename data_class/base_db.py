@@ -1,24 +1,11 @@
-import sqlite3
-from contextlib import contextmanager
 from pathlib import Path
-from threading import Lock
 
+from data_bases.base_db import BaseDB as _PooledBaseDB
 
-class BaseDB:
-    _db_name: str = ""
-    _lock = Lock()
 
-    @classmethod
-    @contextmanager
-    def _connect(cls):
-        with cls._lock:
-            conn = sqlite3.connect(Path("data/dbs_v2") / (cls._db_name + ".db"))
-            try:
-                yield conn
-
-            finally:
-                conn.close()
+class BaseDB(_PooledBaseDB):
+    _db_dir: str = "data/dbs_v2"
 
     @classmethod
     def create_db_dir(cls) -> None:
-        Path("data/dbs_v2").mkdir(parents=True, exist_ok=True)
+        Path(cls._db_dir).mkdir(parents=True, exist_ok=True)
@@ -1,17 +1,149 @@
 import json
-from typing import Any
+import logging
+import re
+import sqlite3
+from typing import Any, Callable
 from uuid import uuid4
 
 from .base_db import BaseDB
 
+logger = logging.getLogger(__name__)
+
 
 class ProfileData:
+    """Profile JSON whose sections are decoded only when first touched.
+
+    An instance is either built in full (`ProfileData()`), backed by the raw
+    JSON document (`from_json`) or by per-section JSON texts
+    (`from_sections`). Characters and notes are not part of the JSON: they
+    come from `loader(name)` when first read.
+    """
+
+    __slots__ = (
+        "_raw",
+        "_doc",
+        "_parts",
+        "_loader",
+        "_access",
+        "_blacklist",
+        "_chars",
+        "_limits",
+        "_notes",
+    )
+
     def __init__(self) -> None:
-        self.access: dict[str, bool] = self.default_access()
-        self.blacklist: dict[str, bool] = self.default_blacklist()
-        self.chars: list[dict[str, Any]] = []
-        self.limits: dict[str, Any] = self.default_limits()
-        self.notes: list[dict[str, Any]] = []
+        self._raw: str | None = None
+        self._doc: dict[str, Any] | None = None
+        self._parts: dict[str, Any] | None = None
+        self._loader: Callable[[str], Any] | None = None
+        self._access: dict[str, bool] | None = self.default_access()
+        self._blacklist: dict[str, bool] | None = self.default_blacklist()
+        self._chars: list[dict[str, Any]] | None = []
+        self._limits: dict[str, Any] | None = self.default_limits()
+        self._notes: list[dict[str, Any]] | None = []
+
+    @classmethod
+    def _lazy(cls) -> "ProfileData":
+        obj = cls.__new__(cls)
+        obj._raw = obj._doc = obj._parts = obj._loader = None
+        obj._access = obj._blacklist = obj._chars = obj._limits = obj._notes = None
+        return obj
+
+    def _section(self, name: str) -> Any:
+        if self._parts is not None:
+            value = self._parts.get(name)
+            if not isinstance(value, str):
+                return value
+
+            try:
+                return json.loads(value)
+
+            except ValueError:
+                return None
+
+        if self._doc is None:
+            try:
+                doc = json.loads(self._raw) if self._raw else {}
+
+            except ValueError:
+                doc = {}
+
+            self._doc = doc if isinstance(doc, dict) else {}
+            self._raw = None
+
+        return self._doc.get(name)
+
+    # region sections
+    @property
+    def access(self) -> dict[str, bool]:
+        if self._access is None:
+            value = self._section("access")
+            self._access = self.default_access()
+            if isinstance(value, dict):
+                self._access.update(value)
+
+            elif self._section("is_admin"):
+                self._access["panel_access"] = True
+
+        return self._access
+
+    @access.setter
+    def access(self, value: dict[str, bool]) -> None:
+        self._access = value
+
+    @property
+    def blacklist(self) -> dict[str, bool]:
+        if self._blacklist is None:
+            value = self._section("blacklist")
+            self._blacklist = {
+                **self.default_blacklist(),
+                **(value if isinstance(value, dict) else {}),
+            }
+
+        return self._blacklist
+
+    @blacklist.setter
+    def blacklist(self, value: dict[str, bool]) -> None:
+        self._blacklist = value
+
+    @property
+    def chars(self) -> list[dict[str, Any]]:
+        if self._chars is None:
+            self._chars = self._loader("chars") if self._loader else []
+
+        return self._chars
+
+    @chars.setter
+    def chars(self, value: list[dict[str, Any]]) -> None:
+        self._chars = value
+
+    @property
+    def limits(self) -> dict[str, Any]:
+        if self._limits is None:
+            value = self._section("limits")
+            self._limits = {
+                **self.default_limits(),
+                **(value if isinstance(value, dict) else {}),
+            }
+
+        return self._limits
+
+    @limits.setter
+    def limits(self, value: dict[str, Any]) -> None:
+        self._limits = value
+
+    @property
+    def notes(self) -> list[dict[str, Any]]:
+        if self._notes is None:
+            self._notes = self._loader("notes") if self._loader else []
+
+        return self._notes
+
+    @notes.setter
+    def notes(self, value: list[dict[str, Any]]) -> None:
+        self._notes = value
+
+    # endregion
 
     @property
     def has_blacklist(self) -> bool:
@@ -71,53 +203,214 @@ class ProfileData:
         }
 
     def to_json(self) -> str:
-        return json.dumps(self.as_dict())
+        # chars and notes live in their own tables, see ProfileDataBase
+        return json.dumps(
+            {"access": self.access, "blacklist": self.blacklist, "limits": self.limits}
+        )
 
     @classmethod
-    def from_json(cls, value: str) -> "ProfileData":
-        new_obj = cls()
-        try:
-            data = json.loads(value)
-            if not isinstance(data, dict):
-                return new_obj
+    def from_json(
+        cls, value: str, loader: Callable[[str], Any] | None = None
+    ) -> "ProfileData":
+        obj = cls._lazy()
+        obj._raw = value
+        obj._loader = loader
+        return obj
 
-        except Exception:
-            return new_obj
+    @classmethod
+    def from_sections(
+        cls,
+        parts: dict[str, Any],
+        loader: Callable[[str], Any] | None = None,
+    ) -> "ProfileData":
+        """Build from decoded sections or their JSON texts."""
+        obj = cls._lazy()
+        obj._parts = dict(parts)
+        obj._loader = loader
+        return obj
 
-        if "access" in data:
-            new_obj.access = {**cls.default_access(), **data.get("access", {})}
 
-        else:
-            new_obj.access = cls.default_access()
-            if data.get("is_admin", False):
-                new_obj.access["panel_access"] = True
+class ProfileDataBase(BaseDB):
+    _db_name = "profiles"
+    _has_fts = False
+    _change_listeners: list[Callable[[str], None]] = []
 
-        new_obj.blacklist = {**cls.default_blacklist(), **data.get("blacklist", {})}
-        new_obj.chars = data.get("chars", [])
-        new_obj.limits = {**cls.default_limits(), **data.get("limits", {})}
-        new_obj.notes = data.get("notes", [])
+    @classmethod
+    def on_change(cls, callback: Callable[[str], None]) -> None:
+        """Call `callback(uuid)` after a profile is created, updated or deleted."""
+        cls._change_listeners.append(callback)
 
-        return new_obj
+    @classmethod
+    def _notify_change(cls, uuid: str) -> None:
+        for callback in cls._change_listeners:
+            try:
+                callback(uuid)
 
-
-class ProfileDataBase(BaseDB):
-    _db_name = "profiles"
+            except Exception as e:
+                logger.exception("profile change listener failed: %s", e)
 
     @classmethod
     def setup_db(cls) -> None:
         cls.create_db_dir()
 
-        with cls._connect() as con:
+        with cls._connect(write=True) as con:
             con.execute("""
                 CREATE TABLE IF NOT EXISTS profile (
                     uuid TEXT PRIMARY KEY,
                     discord_id TEXT UNIQUE,
                     steam_id TEXT UNIQUE,
-                    data TEXT
+                    data TEXT,
+                    username TEXT
+                )
+            """)
+
+            cols = {row[1] for row in con.execute("PRAGMA table_info(profile)")}
+            if "username" not in cols:
+                con.execute("ALTER TABLE profile ADD COLUMN username TEXT")
+
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS profile_note (
+                    id INTEGER PRIMARY KEY,
+                    profile_uuid TEXT NOT NULL
+                        REFERENCES profile(uuid) ON DELETE CASCADE,
+                    date TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    content TEXT NOT NULL
+                )
+            """)
+            con.execute("""
+                CREATE INDEX IF NOT EXISTS profile_note_uuid_idx
+                ON profile_note (profile_uuid, id)
+            """)
+            con.execute("""
+                CREATE INDEX IF NOT EXISTS profile_note_date_idx
+                ON profile_note (date)
+            """)
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS profile_char (
+                    id INTEGER PRIMARY KEY,
+                    profile_uuid TEXT NOT NULL
+                        REFERENCES profile(uuid) ON DELETE CASCADE,
+                    name TEXT NOT NULL,
+                    discord_url TEXT NOT NULL DEFAULT '',
+                    steam_urls TEXT NOT NULL DEFAULT '[]',
+                    weight_mb REAL NOT NULL DEFAULT 0
                 )
             """)
+            con.execute("""
+                CREATE INDEX IF NOT EXISTS profile_char_uuid_idx
+                ON profile_char (profile_uuid, id)
+            """)
+
+            cls._migrate_history(con)
+            con.commit()
+
+            cls._has_fts = cls._setup_search(con)
             con.commit()
 
+    @classmethod
+    def _migrate_history(cls, con) -> None:
+        """Move chars and notes out of the profile JSON into their tables."""
+        legacy = """
+            json_valid(data) AND (
+                json_type(data, '$.notes') IS NOT NULL
+                OR json_type(data, '$.chars') IS NOT NULL
+            )
+        """
+        # Notes were stored newest first, insert them oldest first so the
+        # id order is the chronological order
+        notes = con.execute(f"""
+            INSERT INTO profile_note (profile_uuid, date, status, content)
+            SELECT p.uuid,
+                   COALESCE(json_extract(n.value, '$.date'), ''),
+                   COALESCE(json_extract(n.value, '$.status'), 'info'),
+                   COALESCE(json_extract(n.value, '$.content'), '')
+            FROM profile p, json_each(p.data, '$.notes') n
+            WHERE {legacy.replace("data", "p.data")} AND n.type = 'object'
+            ORDER BY p.rowid, n.key DESC
+        """).rowcount
+        chars = con.execute(f"""
+            INSERT INTO profile_char (
+                profile_uuid, name, discord_url, steam_urls, weight_mb
+            )
+            SELECT p.uuid,
+                   COALESCE(json_extract(c.value, '$.name'), ''),
+                   COALESCE(json_extract(c.value, '$.discord_url'), ''),
+                   COALESCE(json_extract(c.value, '$.steam_urls'), '[]'),
+                   COALESCE(json_extract(c.value, '$.weight_mb'), 0)
+            FROM profile p, json_each(p.data, '$.chars') c
+            WHERE {legacy.replace("data", "p.data")} AND c.type = 'object'
+            ORDER BY p.rowid, c.key
+        """).rowcount
+        profiles = con.execute(f"""
+            UPDATE profile SET data = json_remove(data, '$.notes', '$.chars')
+            WHERE {legacy}
+        """).rowcount
+
+        if profiles:
+            logger.info(
+                "Moved %s notes and %s chars of %s profiles to their tables",
+                notes,
+                chars,
+                profiles,
+            )
+
+    @classmethod
+    def _setup_search(cls, con) -> bool:
+        # Trigram FTS over the searchable columns, synced by triggers. The
+        # profile rowid is not an INTEGER PRIMARY KEY alias and may change on
+        # VACUUM, so the index is rebuilt on every startup.
+        try:
+            con.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS profile_search USING fts5(
+                    uuid, discord_id, steam_id, username,
+                    content='profile', tokenize='trigram'
+                );
+                CREATE TRIGGER IF NOT EXISTS profile_search_ai
+                AFTER INSERT ON profile BEGIN
+                    INSERT INTO profile_search (
+                        rowid, uuid, discord_id, steam_id, username
+                    ) VALUES (
+                        new.rowid, new.uuid, new.discord_id, new.steam_id,
+                        new.username
+                    );
+                END;
+                CREATE TRIGGER IF NOT EXISTS profile_search_ad
+                AFTER DELETE ON profile BEGIN
+                    INSERT INTO profile_search (
+                        profile_search, rowid, uuid, discord_id, steam_id, username
+                    ) VALUES (
+                        'delete', old.rowid, old.uuid, old.discord_id,
+                        old.steam_id, old.username
+                    );
+                END;
+                CREATE TRIGGER IF NOT EXISTS profile_search_au
+                AFTER UPDATE OF uuid, discord_id, steam_id, username ON profile
+                BEGIN
+                    INSERT INTO profile_search (
+                        profile_search, rowid, uuid, discord_id, steam_id, username
+                    ) VALUES (
+                        'delete', old.rowid, old.uuid, old.discord_id,
+                        old.steam_id, old.username
+                    );
+                    INSERT INTO profile_search (
+                        rowid, uuid, discord_id, steam_id, username
+                    ) VALUES (
+                        new.rowid, new.uuid, new.discord_id, new.steam_id,
+                        new.username
+                    );
+                END;
+            """)
+            con.execute(
+                "INSERT INTO profile_search (profile_search) VALUES ('rebuild')"
+            )
+
+        except sqlite3.OperationalError as e:
+            logger.warning("FTS5 trigram unavailable, profile search uses LIKE: %s", e)
+            return False
+
+        return True
+
     @classmethod
     def create_profile(
         cls,
@@ -127,7 +420,7 @@ class ProfileDataBase(BaseDB):
         p_uuid = str(uuid4().hex).upper()
         p_data = ProfileData()
 
-        with cls._connect() as con:
+        with cls._connect(write=True) as con:
             con.execute(
                 """
                 INSERT INTO profile (uuid, discord_id, steam_id, data)
@@ -137,8 +430,49 @@ class ProfileDataBase(BaseDB):
             )
             con.commit()
 
+        cls._notify_change(p_uuid)
         return p_uuid
 
+    @classmethod
+    def create_profiles(
+        cls, rows: list[tuple[str | None, str | None]]
+    ) -> list[tuple[str | None, str | None]]:
+        """Insert (discord_id, steam_id) rows in one transaction.
+
+        Returns `(uuid, None)` for each created row and `(None, field)` for a
+        row that hit the UNIQUE constraint on `field`, in input order.
+        """
+        data_json = ProfileData().to_json()
+        results: list[tuple[str | None, str | None]] = []
+
+        with cls._connect(write=True) as con:
+            for discord_id, steam_id in rows:
+                p_uuid = str(uuid4().hex).upper()
+                cur = con.execute(
+                    """
+                    INSERT INTO profile (uuid, discord_id, steam_id, data)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT DO NOTHING
+                    """,
+                    (p_uuid, discord_id, steam_id, data_json),
+                )
+                if cur.rowcount:
+                    results.append((p_uuid, None))
+                    continue
+
+                taken = con.execute(
+                    "SELECT 1 FROM profile WHERE discord_id = ?", (discord_id,)
+                ).fetchone()
+                results.append((None, "discord_id" if taken else "steam_id"))
+
+            con.commit()
+
+        for p_uuid, _ in results:
+            if p_uuid:
+                cls._notify_change(p_uuid)
+
+        return results
+
     @classmethod
     def update_profile(
         cls,
@@ -146,6 +480,7 @@ class ProfileDataBase(BaseDB):
         discord_id: str | None = None,
         steam_id: str | None = None,
         data: ProfileData | None = None,
+        username: str | None = None,
     ) -> bool:
         fields, values = [], []
         if discord_id is not None:
@@ -160,50 +495,77 @@ class ProfileDataBase(BaseDB):
             fields.append("data = ?")
             values.append(data.to_json())
 
+        if username is not None:
+            fields.append("username = ?")
+            values.append(username)
+
         if not fields:
             return False
 
         values.append(uuid)
         sql = f"UPDATE profile SET {', '.join(fields)} WHERE uuid = ?"
 
-        with cls._connect() as con:
+        with cls._connect(write=True) as con:
             cur = con.execute(sql, values)
             con.commit()
-            return cur.rowcount > 0
+
+        cls._notify_change(uuid)
+        return cur.rowcount > 0
 
     @classmethod
     def delete_profile(cls, uuid: str) -> bool:
-        with cls._connect() as con:
+        with cls._connect(write=True) as con:
             cur = con.execute("DELETE FROM profile WHERE uuid = ?", (uuid,))
             con.commit()
 
-            return cur.rowcount > 0
+        cls._notify_change(uuid)
+        return cur.rowcount > 0
 
     # region geters
+    # Sections every auth check or profile page needs, read with a single
+    # json_extract so the document is parsed only once
+    _EAGER_SECTIONS = ("access", "is_admin", "blacklist", "limits")
+
     @classmethod
-    def _fetch_one(cls, field: str, value: str) -> dict | None:
-        with cls._connect() as con:
-            cur = con.execute(f"SELECT * FROM profile WHERE {field} = ?", (value,))
-            row = cur.fetchone()
+    def _sections_sql(cls) -> str:
+        paths = ", ".join(f"'$.{n}'" for n in cls._EAGER_SECTIONS)
+        return f"CASE WHEN json_valid(data) THEN json_extract(data, {paths}) END"
 
-        if not row:
-            return None
+    @classmethod
+    def _history_loader(cls, uuid: str) -> Callable[[str], list[dict]]:
+        def load(name: str) -> list[dict]:
+            if name == "chars":
+                return cls.list_chars(uuid)
 
-        columns = [col[0] for col in cur.description]
-        record = dict(zip(columns, row))
+            return cls.list_notes(uuid, limit=None)[0]
 
-        data_raw = record.get("data")
-        if isinstance(data_raw, str) and data_raw:
-            try:
-                record["data"] = ProfileData.from_json(data_raw)
+        return load
 
-            except json.JSONDecodeError:
-                record["data"] = ProfileData()
+    @classmethod
+    def _fetch_one(cls, field: str, value: str) -> dict | None:
+        with cls._connect() as con:
+            row = con.execute(
+                "SELECT uuid, discord_id, steam_id, username,"
+                f" {cls._sections_sql()}"
+                f" FROM profile WHERE {field} = ?",
+                (value,),
+            ).fetchone()
 
-        else:
-            record["data"] = ProfileData()
+        if not row:
+            return None
 
-        return record
+        uuid, discord_id, steam_id, username, sections = row
+        values = json.loads(sections) if sections else []
+        return {
+            "uuid": uuid,
+            "discord_id": discord_id,
+            "steam_id": steam_id,
+            "username": username,
+            "data": ProfileData.from_sections(
+                dict(zip(cls._EAGER_SECTIONS, values)),
+                loader=cls._history_loader(uuid),
+            ),
+        }
 
     @classmethod
     def get_profile_by_uuid(cls, value: str) -> dict | None:
@@ -218,23 +580,240 @@ class ProfileDataBase(BaseDB):
         return cls._fetch_one("steam_id", value)
 
     @classmethod
-    def get_all_profiles(cls) -> list[dict]:
+    def _record_from_row(cls, row: tuple) -> dict:
+        uuid, discord_id, steam_id, username, data_json = row
+        return {
+            "uuid": uuid,
+            "discord_id": discord_id,
+            "steam_id": steam_id,
+            "username": username,
+            "data": ProfileData.from_json(data_json, cls._history_loader(uuid)),
+        }
+
+    @classmethod
+    def search_profiles(
+        cls,
+        query: str = "",
+        limit: int = 50,
+        after: int | None = None,
+    ) -> tuple[list[dict], int | None]:
+        """Substring search over ids and username, paged by rowid."""
+        where, params = [], []
+        sql = "SELECT p.rowid, p.uuid, p.discord_id, p.steam_id, p.username, p.data"
+
+        if query and cls._has_fts and len(query) >= 3:
+            sql += " FROM profile_search s JOIN profile p ON p.rowid = s.rowid"
+            where.append("profile_search MATCH ?")
+            params.append('"' + query.replace('"', '""') + '"')
+
+        else:
+            sql += " FROM profile p"
+            if query:
+                like = "%" + re.sub(r"([\\%_])", r"\\\1", query) + "%"
+                where.append(
+                    "(p.uuid LIKE ? ESCAPE '\\' OR p.discord_id LIKE ? ESCAPE '\\'"
+                    " OR p.steam_id LIKE ? ESCAPE '\\' OR p.username LIKE ? ESCAPE '\\')"
+                )
+                params.extend([like] * 4)
+
+        if after is not None:
+            where.append("p.rowid > ?")
+            params.append(after)
+
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+
+        sql += " ORDER BY p.rowid LIMIT ?"
+        params.append(limit + 1)
+
         with cls._connect() as con:
-            cur = con.execute("SELECT uuid, discord_id, steam_id, data FROM profile")
-            rows = cur.fetchall()
+            rows = con.execute(sql, params).fetchall()
 
-        out = []
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = rows[-1][0] if has_more else None
 
-        for uuid, discord_id, steam_id, data_json in rows:
-            rec = {"uuid": uuid, "discord_id": discord_id, "steam_id": steam_id}
-            try:
-                rec["data"] = ProfileData.from_json(data_json)
+        records = [cls._record_from_row(r[1:]) for r in rows]
+        chars = cls.list_chars_many([r["uuid"] for r in records])
+        for rec in records:
+            rec["data"].chars = chars.get(rec["uuid"], [])
+
+        return records, next_cursor
+
+    # endregion
 
-            except Exception:
-                rec["data"] = ProfileData()
+    # region history
+    _NOTE_COLS = "id, date, status, content"
+    _CHAR_COLS = "id, profile_uuid, name, discord_url, steam_urls, weight_mb"
+
+    @staticmethod
+    def _note_from_row(row: tuple) -> dict:
+        note_id, date, status, content = row
+        return {"id": note_id, "date": date, "status": status, "content": content}
+
+    @staticmethod
+    def _char_from_row(row: tuple) -> dict:
+        char_id, _, name, discord_url, steam_urls, weight_mb = row
+        try:
+            urls = json.loads(steam_urls)
+
+        except ValueError:
+            urls = []
+
+        return {
+            "id": char_id,
+            "name": name,
+            "discord_url": discord_url,
+            "steam_urls": urls if isinstance(urls, list) else [],
+            "weight_mb": weight_mb,
+        }
+
+    @staticmethod
+    def _refresh_used(con, uuid: str) -> None:
+        # limits.used is the total weight of the profile's characters
+        con.execute(
+            """
+            UPDATE profile SET data = json_set(
+                data, '$.limits.used',
+                (SELECT ROUND(COALESCE(SUM(weight_mb), 0), 2)
+                 FROM profile_char WHERE profile_uuid = ?)
+            )
+            WHERE uuid = ? AND json_valid(data)
+        """,
+            (uuid, uuid),
+        )
+
+    @classmethod
+    def add_note(
+        cls, uuid: str, content: str, status: str = "info", date: str = ""
+    ) -> int:
+        with cls._connect(write=True) as con:
+            cur = con.execute(
+                """
+                INSERT INTO profile_note (profile_uuid, date, status, content)
+                VALUES (?, ?, ?, ?)
+            """,
+                (uuid, date, status, content),
+            )
+            con.commit()
+
+        cls._notify_change(uuid)
+        return cur.lastrowid  # type: ignore
+
+    @classmethod
+    def list_notes(
+        cls, uuid: str, limit: int | None = 20, before: int | None = None
+    ) -> tuple[list[dict], int | None]:
+        """Newest notes first, paged by note id."""
+        sql = f"SELECT {cls._NOTE_COLS} FROM profile_note WHERE profile_uuid = ?"
+        params: list[Any] = [uuid]
+        if before is not None:
+            sql += " AND id < ?"
+            params.append(before)
+
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        with cls._connect() as con:
+            rows = con.execute(sql, params).fetchall()
+
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = rows[-1][0] if has_more else None
+        return [cls._note_from_row(r) for r in rows], next_cursor
+
+    @classmethod
+    def add_char(
+        cls,
+        uuid: str,
+        name: str,
+        discord_url: str = "",
+        steam_urls: list[str] | None = None,
+        weight_mb: float = 0,
+    ) -> int:
+        with cls._connect(write=True) as con:
+            cur = con.execute(
+                """
+                INSERT INTO profile_char (
+                    profile_uuid, name, discord_url, steam_urls, weight_mb
+                ) VALUES (?, ?, ?, ?, ?)
+            """,
+                (uuid, name, discord_url, json.dumps(steam_urls or []), weight_mb),
+            )
+            cls._refresh_used(con, uuid)
+            con.commit()
+
+        cls._notify_change(uuid)
+        return cur.lastrowid  # type: ignore
+
+    @classmethod
+    def delete_char(cls, uuid: str, char_id: int) -> bool:
+        with cls._connect(write=True) as con:
+            cur = con.execute(
+                "DELETE FROM profile_char WHERE id = ? AND profile_uuid = ?",
+                (char_id, uuid),
+            )
+            if cur.rowcount:
+                cls._refresh_used(con, uuid)
+
+            con.commit()
+
+        cls._notify_change(uuid)
+        return cur.rowcount > 0
+
+    @classmethod
+    def set_char_weights_many(cls, weights: dict[str, dict[int, float]]) -> None:
+        """Update weights of many profiles' characters in one transaction."""
+        with cls._connect(write=True) as con:
+            for uuid, by_char in weights.items():
+                con.executemany(
+                    "UPDATE profile_char SET weight_mb = ?"
+                    " WHERE id = ? AND profile_uuid = ?",
+                    [(mb, char_id, uuid) for char_id, mb in by_char.items()],
+                )
+                cls._refresh_used(con, uuid)
+
+            con.commit()
+
+        for uuid in weights:
+            cls._notify_change(uuid)
+
+    @classmethod
+    def list_chars(cls, uuid: str) -> list[dict]:
+        return cls.list_chars_many([uuid]).get(uuid, [])
+
+    @classmethod
+    def list_all_chars(cls) -> dict[str, list[dict]]:
+        with cls._connect() as con:
+            rows = con.execute(
+                f"SELECT {cls._CHAR_COLS} FROM profile_char ORDER BY profile_uuid, id"
+            ).fetchall()
+
+        result: dict[str, list[dict]] = {}
+        for row in rows:
+            result.setdefault(row[1], []).append(cls._char_from_row(row))
+
+        return result
+
+    @classmethod
+    def list_chars_many(cls, uuids: list[str]) -> dict[str, list[dict]]:
+        if not uuids:
+            return {}
+
+        marks = ", ".join("?" * len(uuids))
+        with cls._connect() as con:
+            rows = con.execute(
+                f"SELECT {cls._CHAR_COLS} FROM profile_char"
+                f" WHERE profile_uuid IN ({marks}) ORDER BY profile_uuid, id",
+                uuids,
+            ).fetchall()
 
-            out.append(rec)
+        result: dict[str, list[dict]] = {}
+        for row in rows:
+            result.setdefault(row[1], []).append(cls._char_from_row(row))
 
-        return out
+        return result
 
     # endregion
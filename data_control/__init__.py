@@ -1,3 +1,4 @@
 from .auto_tax import AutoTax
 from .config import Config
+from .http_client import HttpClient, Upstream
 from .server_control import ServerControl, ServerStatus
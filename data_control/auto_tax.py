@@ -1,44 +1,45 @@
 import asyncio
 import base64
+import hashlib
 import json
 import logging
 import os
+import random
+import threading
 from datetime import datetime, timedelta, timezone
 from decimal import ROUND_HALF_UP, Decimal
 from pathlib import Path
+from threading import Lock
 from typing import Final, Literal
 
-from requests import Response, Session
+from requests import Response
 
 from data_bases.payment_db import PaymentServiceDB
+from data_bases.tax_queue_db import TaxJob, TaxQueueDB
 
 from .config import Config
+from .http_client import HttpClient
 
 logger = logging.getLogger(__name__)
 TWOPLACES = Decimal("0.01")
 
 DATA_DIR = Path(os.getenv("DATA_DIR", "./data"))
 QUEUE_FILE = DATA_DIR / "tax_income_queue.json"
+RECEIPT_DIR = DATA_DIR / "receipts"
+RECEIPT_CACHE_MAX_BYTES = 256 * 1024 * 1024
 
 
 def _now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
 
-def _iso(dt: datetime) -> str:
-    return (
-        dt.replace(microsecond=0, tzinfo=timezone.utc)
-        .isoformat()
-        .replace("+00:00", "Z")
-    )
-
-
 def _q2(x: Decimal) -> Decimal:
     return x.quantize(TWOPLACES, ROUND_HALF_UP)
 
 
 class AutoTax:
-    _tax_session: Session = Session()
+    _tax_session = HttpClient.session("nalog")
+    _auth_lock = Lock()
     _device_id = ""
     _token_expire = ""
     _refresh_token = ""
@@ -53,15 +54,22 @@ class AutoTax:
     @classmethod
     def _request_with_retry(cls, method: str, path: str, **kwargs) -> Response:
         if cls._is_token_expired():
-            logger.info("AutoTax: token expired → refresh()")
-            cls._refresh()
+            with cls._auth_lock:
+                if cls._is_token_expired():
+                    logger.info("AutoTax: token expired → refresh()")
+                    cls._refresh()
 
         url = cls._base_url(path)
-        resp = cls._tax_session.request(method, url, **kwargs)
+        auth = cls._tax_session.headers.get("Authorization")
+        resp = HttpClient.request("nalog", method, url, **kwargs)
         if resp.status_code == 401:
-            logger.warning("AutoTax: got 401 → re-login and retry once")
-            cls._login()
-            resp = cls._tax_session.request(method, url, **kwargs)
+            with cls._auth_lock:
+                # Another thread may have re-logged in while we waited
+                if cls._tax_session.headers.get("Authorization") == auth:
+                    logger.warning("AutoTax: got 401 → re-login and retry once")
+                    cls._login()
+
+            resp = HttpClient.request("nalog", method, url, **kwargs)
 
         if not resp.ok:
             raise RuntimeError(
@@ -125,7 +133,8 @@ class AutoTax:
     @classmethod
     def _login(cls) -> None:
         cls._device_id = cls._generate_source_device_id()
-        resp = cls._tax_session.post(
+        resp = HttpClient.post(
+            "nalog",
             cls._base_url("auth/lkfl"),
             json={
                 "username": Config.tax_inn(),
@@ -147,7 +156,8 @@ class AutoTax:
 
     @classmethod
     def _refresh(cls) -> None:
-        resp = cls._tax_session.post(
+        resp = HttpClient.post(
+            "nalog",
             cls._base_url("auth/token"),
             json={
                 "refreshToken": cls._refresh_token,
@@ -166,11 +176,42 @@ class AutoTax:
 
     @classmethod
     def setup(cls) -> None:
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        TaxQueueDB.create_db_table()
+        cls._migrate_queue_file()
+        cls._login()
+
+    @classmethod
+    def _migrate_queue_file(cls) -> None:
         if not QUEUE_FILE.exists():
-            QUEUE_FILE.write_text("[]", encoding="utf-8")
+            return
 
-        cls._login()
+        try:
+            items = json.loads(QUEUE_FILE.read_text(encoding="utf-8") or "[]")
+            jobs = []
+            for item in items:
+                ts = item.get("next_try_ts")
+                jobs.append(
+                    TaxJob(
+                        payment_id=item["payment_id"],
+                        services=[(n, a) for n, a in item.get("services", [])],
+                        attempts=int(item.get("attempts", 0)),
+                        last_error=item.get("last_error"),
+                        next_try_ts=(
+                            datetime.fromisoformat(
+                                ts.replace("Z", "+00:00")
+                            ).timestamp()
+                            if ts
+                            else _now_utc().timestamp()
+                        ),
+                    )
+                )
+
+            TaxQueueDB.enqueue_many(jobs)
+            QUEUE_FILE.rename(QUEUE_FILE.with_suffix(".json.migrated"))
+            logger.info(f"AutoTax: migrated {len(jobs)} queued receipts to SQLite")
+
+        except Exception as e:
+            logger.error(f"AutoTax._migrate_queue_file error: {e}")
 
     @classmethod
     def post_income(cls, services: list[tuple[str, Decimal]]) -> str:
@@ -242,146 +283,172 @@ class AutoTax:
         resp = cls.req_get(f"receipt/{Config.tax_inn()}/{uuid}/print")
         return resp.content
 
-    # backoff: 1м, 5м
-    _BACKOFF = [60, 300]
+    @classmethod
+    def _receipt_path(cls, uuid: str) -> Path:
+        return RECEIPT_DIR / f"{hashlib.sha256(uuid.encode()).hexdigest()}.png"
 
     @classmethod
-    def enqueue_income(
-        cls, payment_id: str, services: list[tuple[str, Decimal]]
-    ) -> None:
+    def get_check_png_path(cls, uuid: str) -> Path:
+        """Receipt PNG on disk, fetched once: a receipt never changes."""
+        path = cls._receipt_path(uuid)
+        if path.exists():
+            os.utime(path)  # mtime marks last use for eviction
+            return path
+
+        content = cls.get_check_png(uuid)
+        if not isinstance(content, (bytes, bytearray)):
+            raise RuntimeError("receipt content is not bytes")
+
+        RECEIPT_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(content)
+        tmp.replace(path)
+
+        cls._evict_receipts()
+        return path
+
+    @classmethod
+    def _evict_receipts(cls) -> None:
         try:
-            queue = cls._load_queue()
-            existing = next(
-                (x for x in queue if x.get("payment_id") == payment_id), None
-            )
-            ser = [[name, f"{_q2(Decimal(amount)):.2f}"] for name, amount in services]
-            now = _now_utc()
-            if existing:
-                existing["services"] = ser
-                existing["attempts"] = int(existing.get("attempts", 0))
-                existing["last_error"] = None
-                existing["next_try_ts"] = _iso(now)
-
-            else:
-                queue.append(
-                    {
-                        "payment_id": payment_id,
-                        "services": ser,
-                        "attempts": 0,
-                        "last_error": None,
-                        "next_try_ts": _iso(now),
-                    }
-                )
+            files = [(f, f.stat()) for f in RECEIPT_DIR.glob("*.png")]
+            total = sum(st.st_size for _, st in files)
+            if total <= RECEIPT_CACHE_MAX_BYTES:
+                return
 
-            cls._save_queue(queue)
+            for f, st in sorted(files, key=lambda x: x[1].st_mtime):
+                f.unlink(missing_ok=True)
+                total -= st.st_size
+                if total <= RECEIPT_CACHE_MAX_BYTES:
+                    break
 
         except Exception as e:
-            logger.error(f"AutoTax.enqueue_income error: {e}")
+            logger.error(f"AutoTax._evict_receipts error: {e}")
 
     @classmethod
-    def _load_queue(cls) -> list[dict]:
+    def prefetch_check_png(cls, uuid: str) -> None:
         try:
-            QUEUE_FILE.parent.mkdir(parents=True, exist_ok=True)
-            if not QUEUE_FILE.exists():
-                return []
-
-            return json.loads(QUEUE_FILE.read_text(encoding="utf-8") or "[]")
+            cls.get_check_png_path(uuid)
 
         except Exception as e:
-            logger.error(f"AutoTax._load_queue error: {e}")
-            return []
+            logger.warning(f"AutoTax: receipt prefetch failed for {uuid}: {e}")
+
+    # backoff: 1м, 2м, 4м ... до 1ч, с разбросом ±25%
+    _BACKOFF_BASE = 60
+    _BACKOFF_MAX = 3600
+    _LEASE_SEC = 300
+
+    _stats_lock = Lock()
+    _stats = {"succeeded": 0, "failed": 0}
+
+    @classmethod
+    def _backoff(cls, attempts: int) -> float:
+        delay = min(cls._BACKOFF_MAX, cls._BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+        return delay * random.uniform(0.75, 1.25)
+
+    @classmethod
+    def _count(cls, key: str) -> None:
+        with cls._stats_lock:
+            cls._stats[key] += 1
+
+    @classmethod
+    def queue_metrics(cls) -> dict:
+        with cls._stats_lock:
+            done, failed = cls._stats["succeeded"], cls._stats["failed"]
+
+        total = done + failed
+        return {
+            **TaxQueueDB.stats(),
+            "succeeded": done,
+            "failed": failed,
+            "success_rate": round(done / total, 3) if total else None,
+        }
 
     @classmethod
-    def _save_queue(cls, queue: list[dict]) -> None:
+    def enqueue_income(
+        cls, payment_id: str, services: list[tuple[str, Decimal]]
+    ) -> None:
         try:
-            tmp = QUEUE_FILE.with_suffix(".json.tmp")
-            tmp.write_text(
-                json.dumps(queue, ensure_ascii=False, indent=2), encoding="utf-8"
-            )
-            tmp.replace(QUEUE_FILE)
+            ser = [(name, f"{_q2(Decimal(amount)):.2f}") for name, amount in services]
+            TaxQueueDB.enqueue(payment_id, ser)
 
         except Exception as e:
-            logger.error(f"AutoTax._save_queue error: {e}")
+            logger.error(f"AutoTax.enqueue_income error: {e}")
 
     @classmethod
     def remove_from_queue(cls, payment_id: str) -> None:
         try:
-            queue = cls._load_queue()
-            filtered = [item for item in queue if item.get("payment_id") != payment_id]
-            if len(filtered) != len(queue):
-                cls._save_queue(filtered)
+            TaxQueueDB.ack(payment_id)
+
         except Exception as e:
             logger.error(f"AutoTax.remove_from_queue error: {e}")
 
+    @classmethod
+    def _process_job(cls, job: TaxJob) -> None:
+        try:
+            state = PaymentServiceDB.get_payment_tax_state(job.payment_id)
+            if not state:
+                raise RuntimeError(f"payment {job.payment_id} not found")
+
+            pay_status, tax_check_id = state
+            if not tax_check_id:
+                if pay_status != "done":
+                    raise RuntimeError(f"payment {job.payment_id} status is not 'done'")
+
+                services = [(name, Decimal(amount)) for name, amount in job.services]
+                tax_uuid = cls.post_income(services)
+                PaymentServiceDB.set_tax_check_id(job.payment_id, tax_uuid)
+                cls.prefetch_check_png(tax_uuid)
+
+            TaxQueueDB.ack(job.payment_id)
+            cls._count("succeeded")
+
+        except Exception as e:
+            cls._count("failed")
+            delay = cls._backoff(job.attempts + 1)
+            TaxQueueDB.retry_later(
+                job.payment_id, str(e), _now_utc().timestamp() + delay
+            )
+
+    # Dispatcher state, bound when run_queue_worker starts
+    _loop: asyncio.AbstractEventLoop | None = None
+    _wakeup: asyncio.Event | None = None
+
+    @classmethod
+    def notify_queue(cls) -> None:
+        """Wake the queue worker now; safe to call from any thread."""
+        if cls._loop is not None and cls._wakeup is not None:
+            cls._loop.call_soon_threadsafe(cls._wakeup.set)
+
     @classmethod
     async def run_queue_worker(
-        cls, interval_sec: int = 60, batch_size: int = 10
+        cls, interval_sec: int = 60, batch_size: int = 10, concurrency: int = 4
     ) -> None:
         logger.info("AutoTax queue worker started")
+        cls._loop = asyncio.get_running_loop()
+        cls._wakeup = asyncio.Event()
+        sem = asyncio.Semaphore(concurrency)
+
+        async def submit(job: TaxJob) -> None:
+            async with sem:
+                await asyncio.to_thread(cls._process_job, job)
+
         while True:
+            cls._wakeup.clear()
             try:
-                queue = cls._load_queue()
-                now = _now_utc()
-                due: list[dict] = []
-                rest: list[dict] = []
-                for item in queue:
-                    ts = item.get("next_try_ts")
-                    try_time = (
-                        datetime.fromisoformat(ts.replace("Z", "+00:00")) if ts else now
-                    )
-                    (due if try_time <= now else rest).append(item)
-
-                to_process = due[:batch_size]
-                rest.extend(due[batch_size:])
-                processed_ids: set[str] = set()
-
-                for item in to_process:
-                    payment_id = item.get("payment_id")
-                    if not payment_id:
-                        logger.error("AutoTax queue item missing payment_id")
-                        continue
-
-                    services = [
-                        (name, Decimal(amount_str))
-                        for name, amount_str in item.get("services", [])
-                    ]
-                    attempts = int(item.get("attempts", 0))
-
-                    try:
-                        pay = PaymentServiceDB.get_payment(payment_id)
-                        if pay and pay.tax_check_id:
-                            processed_ids.add(payment_id)
-                            continue
-
-                        if not pay:
-                            raise RuntimeError(f"payment {payment_id} not found")
-
-                        if getattr(pay, "status", None) != "done":
-                            raise RuntimeError(
-                                f"payment {payment_id} status is not 'done'"
-                            )
-
-                        tax_uuid = cls.post_income(services)
-                        pay.tax_check_id = tax_uuid
-                        PaymentServiceDB.upsert_payment(payment_id, pay)
-
-                        processed_ids.add(payment_id)
-
-                    except Exception as e:
-                        attempts += 1
-                        delay = cls._BACKOFF[min(attempts - 1, len(cls._BACKOFF) - 1)]
-                        next_ts = _iso(now + timedelta(seconds=delay))
-                        item["attempts"] = attempts
-                        item["last_error"] = str(e)[:500]
-                        item["next_try_ts"] = next_ts
-                        rest.append(item)
-
-                remaining = [
-                    i for i in rest if i.get("payment_id") not in processed_ids
-                ]
-                cls._save_queue(remaining)
+                # Lease outlives the batch so a crashed pass is retried later
+                jobs = await asyncio.to_thread(
+                    TaxQueueDB.claim_due, batch_size, cls._LEASE_SEC
+                )
+                await asyncio.gather(*(submit(job) for job in jobs))
+
+                if len(jobs) == batch_size:
+                    continue
 
             except Exception as e:
                 logger.error(f"AutoTax worker loop error: {e}")
 
-            await asyncio.sleep(interval_sec)
+            try:
+                await asyncio.wait_for(cls._wakeup.wait(), timeout=interval_sec)
+
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from threading import Lock
+
+import httpx
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_BACKOFF_BASE_SEC = 0.3
+_RETRY_AFTER_MAX_SEC = 5.0
+
+
+class _CappedRetry(Retry):
+    """Retry whose Retry-After wait is capped like the async face's."""
+
+    def get_retry_after(self, response) -> float | None:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+
+        return min(retry_after, _RETRY_AFTER_MAX_SEC)
+
+
+@dataclass(frozen=True)
+class Upstream:
+    name: str
+    timeout: tuple[float, float] = (3.05, 10)  # connect, read
+    pool_size: int = 10
+    retries: int = 2
+    # Methods retried on a retryable status; connect errors are retried for
+    # any method since the request never reached the server
+    retry_methods: frozenset[str] = frozenset(Retry.DEFAULT_ALLOWED_METHODS)
+    retry_statuses: frozenset[int] = frozenset({429, 502, 503, 504})
+
+
+UPSTREAMS: dict[str, Upstream] = {
+    u.name: u
+    for u in (
+        # Web API is read only, POST GetPublishedFileDetails is safe to repeat
+        Upstream(
+            "steam_api",
+            timeout=(3.05, 8),
+            pool_size=16,
+            retry_methods=frozenset(Retry.DEFAULT_ALLOWED_METHODS | {"POST"}),
+        ),
+        Upstream("steam_community", timeout=(3.05, 8), pool_size=32),
+        Upstream("discord", pool_size=32),
+        Upstream("nalog", timeout=(5, 20), pool_size=8),
+    )
+}
+
+
+class _Stats:
+    __slots__ = ("buckets", "count", "errors", "total_ms", "max_ms", "statuses")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.statuses: dict[str, int] = {}
+
+    def observe(self, ms: float, status: int | None) -> None:
+        i = 0
+        while i < len(_BUCKETS_MS) and ms > _BUCKETS_MS[i]:
+            i += 1
+
+        self.buckets[i] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if status is None:
+            self.errors += 1
+        else:
+            key = f"{status // 100}xx"
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def _quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return float(_BUCKETS_MS[i]) if i < len(_BUCKETS_MS) else self.max_ms
+
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        labels = [f"<={b}ms" for b in _BUCKETS_MS] + [f">{_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "statuses": dict(self.statuses),
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "p50_ms": self._quantile(0.5),
+            "p95_ms": self._quantile(0.95),
+            "max_ms": round(self.max_ms, 1),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class HttpClient:
+    """Pooled outbound HTTP for every external integration.
+
+    Each upstream from UPSTREAMS gets its own keep-alive session with a
+    bounded connection pool, default timeouts and a retry policy, and its
+    latencies are collected into a histogram exposed by metrics(). The sync
+    face is built on requests, the async one on an httpx.AsyncClient with
+    the same limits and policy.
+    """
+
+    _lock = Lock()
+    _sessions: dict[str, Session] = {}
+    _stats: dict[str, _Stats] = {}
+    _async_clients: dict[
+        str,
+        tuple[asyncio.AbstractEventLoop, httpx.AsyncClient, asyncio.Semaphore],
+    ] = {}
+
+    @classmethod
+    def _upstream(cls, name: str) -> Upstream:
+        upstream = UPSTREAMS.get(name)
+        if upstream is None:
+            raise KeyError(f"Unknown upstream: {name}")
+
+        return upstream
+
+    @classmethod
+    def session(cls, name: str) -> Session:
+        """The pooled session of an upstream, e.g. to set persistent headers."""
+        sess = cls._sessions.get(name)
+        if sess is not None:
+            return sess
+
+        with cls._lock:
+            sess = cls._sessions.get(name)
+            if sess is None:
+                sess = cls._sessions[name] = cls._build_session(cls._upstream(name))
+
+        return sess
+
+    @staticmethod
+    def _build_session(upstream: Upstream) -> Session:
+        retry = _CappedRetry(
+            total=upstream.retries,
+            read=0,
+            backoff_factor=0.3,
+            status_forcelist=upstream.retry_statuses,
+            allowed_methods=upstream.retry_methods,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        # pool_block keeps the number of open connections per host bounded
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=upstream.pool_size,
+            pool_block=True,
+            max_retries=retry,
+        )
+        sess = Session()
+        sess.mount("https://", adapter)
+        sess.mount("http://", adapter)
+        return sess
+
+    @classmethod
+    def _observe(cls, name: str, ms: float, status: int | None) -> None:
+        with cls._lock:
+            stats = cls._stats.get(name)
+            if stats is None:
+                stats = cls._stats[name] = _Stats()
+
+            stats.observe(ms, status)
+
+    @classmethod
+    def request(cls, name: str, method: str, url: str, **kwargs) -> Response:
+        """Send a request through the upstream's session.
+
+        Retries happen inside the call, the recorded latency is what the
+        caller waited for in total.
+        """
+        kwargs.setdefault("timeout", cls._upstream(name).timeout)
+        sess = cls.session(name)
+
+        t0 = time.perf_counter()
+        status = None
+        try:
+            resp = sess.request(method, url, **kwargs)
+            status = resp.status_code
+            return resp
+
+        finally:
+            cls._observe(name, (time.perf_counter() - t0) * 1000, status)
+
+    @classmethod
+    def get(cls, name: str, url: str, **kwargs) -> Response:
+        return cls.request(name, "GET", url, **kwargs)
+
+    @classmethod
+    def post(cls, name: str, url: str, **kwargs) -> Response:
+        return cls.request(name, "POST", url, **kwargs)
+
+    @classmethod
+    def put(cls, name: str, url: str, **kwargs) -> Response:
+        return cls.request(name, "PUT", url, **kwargs)
+
+    @classmethod
+    def _async_entry(
+        cls, name: str
+    ) -> tuple[asyncio.AbstractEventLoop, httpx.AsyncClient, asyncio.Semaphore]:
+        """The pooled async client of an upstream for the running loop."""
+        loop = asyncio.get_running_loop()
+        entry = cls._async_clients.get(name)
+        if entry is not None and entry[0] is loop:
+            return entry
+
+        upstream = cls._upstream(name)
+        client = httpx.AsyncClient(
+            timeout=cls._async_timeout(upstream.timeout),
+            transport=httpx.AsyncHTTPTransport(
+                retries=upstream.retries,
+                limits=httpx.Limits(
+                    max_connections=upstream.pool_size,
+                    max_keepalive_connections=upstream.pool_size,
+                ),
+            ),
+        )
+        # Requests queue here rather than in httpcore, whose pool gets slow
+        # with many waiters
+        entry = (loop, client, asyncio.Semaphore(upstream.pool_size))
+        cls._async_clients[name] = entry
+        return entry
+
+    @staticmethod
+    def _async_timeout(timeout) -> httpx.Timeout:
+        if isinstance(timeout, httpx.Timeout):
+            return timeout
+
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        # Waiting for a free pooled connection is bounded by the upstream itself
+        return httpx.Timeout(connect=connect, read=read, write=read, pool=None)
+
+    @staticmethod
+    def _retry_delay(resp: httpx.Response, attempt: int) -> float:
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), _RETRY_AFTER_MAX_SEC)
+
+            except ValueError:
+                pass
+
+        return _BACKOFF_BASE_SEC * 2**attempt
+
+    @classmethod
+    async def arequest(
+        cls, name: str, method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        """request() for coroutines, without tying up a thread.
+
+        Connect errors are retried by the transport, retryable statuses by
+        the loop below, following the same policy as the sync session.
+        """
+        upstream = cls._upstream(name)
+        if "timeout" in kwargs:
+            kwargs["timeout"] = cls._async_timeout(kwargs["timeout"])
+
+        _, client, limit = cls._async_entry(name)
+        retryable = method.upper() in upstream.retry_methods
+
+        t0 = time.perf_counter()
+        status = None
+        try:
+            attempt = 0
+            while True:
+                async with limit:
+                    resp = await client.request(method, url, **kwargs)
+
+                if (
+                    not retryable
+                    or attempt >= upstream.retries
+                    or resp.status_code not in upstream.retry_statuses
+                ):
+                    status = resp.status_code
+                    return resp
+
+                await asyncio.sleep(cls._retry_delay(resp, attempt))
+                attempt += 1
+
+        finally:
+            cls._observe(name, (time.perf_counter() - t0) * 1000, status)
+
+    @classmethod
+    async def aget(cls, name: str, url: str, **kwargs) -> httpx.Response:
+        return await cls.arequest(name, "GET", url, **kwargs)
+
+    @classmethod
+    async def apost(cls, name: str, url: str, **kwargs) -> httpx.Response:
+        return await cls.arequest(name, "POST", url, **kwargs)
+
+    @classmethod
+    async def aput(cls, name: str, url: str, **kwargs) -> httpx.Response:
+        return await cls.arequest(name, "PUT", url, **kwargs)
+
+    @classmethod
+    def metrics(cls) -> dict:
+        with cls._lock:
+            return {name: s.snapshot() for name, s in cls._stats.items()}
+
+    @classmethod
+    def close(cls) -> None:
+        with cls._lock:
+            for sess in cls._sessions.values():
+                sess.close()
+
+            cls._sessions.clear()
+
+    @classmethod
+    async def aclose(cls) -> None:
+        loop = asyncio.get_running_loop()
+        clients, cls._async_clients = cls._async_clients, {}
+        for client_loop, client, _ in clients.values():
+            if client_loop is loop:
+                await client.aclose()
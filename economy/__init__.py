@@ -1 +1,9 @@
-from .game_db import GameDBProcessor
\ No newline at end of file
+# GameDBProcessor is imported lazily: the aggregation workers import
+# economy.inventory and must not pull in game_db and its dependencies
+def __getattr__(name: str):
+    if name == "GameDBProcessor":
+        from .game_db import GameDBProcessor
+
+        return GameDBProcessor
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,92 +1,227 @@
 import asyncio
+import hashlib
 import json
-import shutil
+import logging
+import multiprocessing
+import os
 import sqlite3
+import time
+from concurrent.futures import (
+    CancelledError,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from concurrent.futures.process import BrokenProcessPool
 from datetime import UTC, datetime
 from pathlib import Path
+from threading import Event, Lock
 
+from data_bases import EconomyDB
 from data_control import ServerControl, ServerStatus
 
+from .inventory import add_inventory, aggregate_chunk, merge_totals
+
+logger = logging.getLogger(__name__)
+
+
+class CycleCancelled(Exception):
+    pass
+
 
 class GameDBProcessor:
-    DB_PATH = Path("data/game_server.db")
+    SOURCE_DB = Path("/root/gmod/garrysmod/sv.db")
     JSON_PATH = Path("data/game_server.json")
+    SNAPSHOT_DIR = Path("data/snapshots")
+
+    INTERVAL_SEC = 15 * 60
+
+    _SNAPSHOT_TS = "%Y%m%d_%H%M%S"
+    _FETCH_SIZE = 500
+    _BUSY_TIMEOUT_SEC = 5.0
+    _CHUNK_ROWS = 2000
+    _PARALLEL_MIN_ROWS = 10000
+    _WORKERS = min(4, os.cpu_count() or 1)
+    _pool: ProcessPoolExecutor | None = None
+
+    # One worker: a cycle never runs twice at once and never on the loop
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="economy")
+    _cycle_lock = Lock()
+    _stop = Event()
+    _runs = {
+        "cycles": 0,
+        "overlaps": 0,
+        "failures": 0,
+        "cancelled": 0,
+        "last_error": None,
+        "last_status_ms": None,
+        "last_cycle_ms": None,
+        "max_cycle_ms": 0.0,
+    }
+
+    _last_cycle: dict = {}
+    # Fingerprint, inventory rows digest and totals digest of the last cycle
+    _seen: dict = {}
+    _counters = {
+        "produced": 0,
+        "skipped_source": 0,
+        "skipped_rows": 0,
+        "skipped_totals": 0,
+    }
 
     @classmethod
-    def download_db(cls, db_path: Path = Path("data/game_server.db")) -> None:
-        shutil.copy(Path("/root/gmod/garrysmod/sv.db"), db_path)
-
-    @classmethod
-    def _cleanup_db(cls) -> None:
-        if not cls.DB_PATH.exists():
-            raise FileNotFoundError("Database file not found. Download it first.")
-
-        conn = sqlite3.connect(cls.DB_PATH)
-        cursor = conn.cursor()
+    def _open_source(cls) -> sqlite3.Connection:
+        """Read-only connection to the live game database.
 
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [row[0] for row in cursor.fetchall()]
+        Nothing is copied: SQLite only reads the pages the query touches, and
+        the single SELECT runs in one read transaction, so it sees a
+        consistent state even while the game keeps writing.
+        """
+        if not cls.SOURCE_DB.exists():
+            raise FileNotFoundError(f"Game database not found: {cls.SOURCE_DB}")
 
-        protected = {"spf2_char_data", "sqlite_sequence"}
+        uri = f"{cls.SOURCE_DB.resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=cls._BUSY_TIMEOUT_SEC)
+        conn.execute("PRAGMA query_only = 1")
+        return conn
 
-        for table in tables:
-            if table not in protected:
-                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    @classmethod
+    def _source_fingerprint(cls) -> tuple:
+        """mtime and size of the database and its WAL, cheap to compare.
+
+        PRAGMA data_version would only tell changes apart on one long lived
+        connection, while every cycle opens a fresh one.
+        """
+        parts = []
+        for path in (
+            cls.SOURCE_DB,
+            cls.SOURCE_DB.with_name(cls.SOURCE_DB.name + "-wal"),
+        ):
+            try:
+                st = path.stat()
+                parts.append((st.st_mtime_ns, st.st_size))
 
-        cursor.execute("DELETE FROM spf2_char_data WHERE key != 'inventory'")
+            except FileNotFoundError:
+                parts.append(None)
 
-        conn.commit()
-        conn.close()
+        return tuple(parts)
 
     @classmethod
-    def _drop_json(cls) -> Path:
-        if not cls.DB_PATH.exists():
-            raise FileNotFoundError("Database file not found. Download it first.")
+    def _read_inventory_rows(cls) -> tuple[list[str], dict]:
+        """Raw inventory JSON of every character, and read metrics."""
+        t0 = time.perf_counter()
+        rows: list[str] = []
+        payload_bytes = 0
+
+        conn = cls._open_source()
+        try:
+            cur = conn.execute(
+                "SELECT json FROM spf2_char_data WHERE key = 'inventory'"
+            )
+            while batch := cur.fetchmany(cls._FETCH_SIZE):
+                cls._check_cancel()
+                for (json_str,) in batch:
+                    if not json_str:
+                        continue
+
+                    rows.append(json_str)
+                    payload_bytes += len(json_str)
+
+        finally:
+            conn.close()
+
+        metrics = {
+            "rows": len(rows),
+            "bytes_read": payload_bytes,
+            "source_bytes": cls.SOURCE_DB.stat().st_size,
+            "read_ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+        return rows, metrics
+
+    @staticmethod
+    def _rows_digest(rows: list[str]) -> str:
+        h = hashlib.sha256()
+        for json_str in rows:
+            h.update(json_str.encode("utf-8", "surrogatepass"))
+            h.update(b"\0")
+
+        return h.hexdigest()
 
-        conn = sqlite3.connect(cls.DB_PATH)
-        cursor = conn.cursor()
+    @classmethod
+    def _process_pool(cls) -> ProcessPoolExecutor:
+        if cls._pool is None:
+            # spawn, not fork: the server process has threads holding locks
+            cls._pool = ProcessPoolExecutor(
+                max_workers=cls._WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
 
-        cursor.execute(
-            "SELECT char_id, json FROM spf2_char_data WHERE key = 'inventory'"
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        return cls._pool
 
+    @classmethod
+    def _aggregate(cls, rows: list[str]) -> list[dict]:
+        """Item totals sorted by count, parsed in chunks.
+
+        Big inputs are spread over a process pool, each chunk coming back as
+        partial totals that are merged here.
+        """
+        chunks = [
+            rows[i : i + cls._CHUNK_ROWS] for i in range(0, len(rows), cls._CHUNK_ROWS)
+        ]
         totals: dict[str, int] = {}
 
-        for _, json_str in rows:
+        if cls._WORKERS < 2 or len(rows) < cls._PARALLEL_MIN_ROWS:
+            for chunk in chunks:
+                cls._check_cancel()
+                for json_str in chunk:
+                    add_inventory(totals, json_str)
+
+        else:
+            futures = [cls._process_pool().submit(aggregate_chunk, c) for c in chunks]
             try:
-                payload = json.loads(json_str)
+                for fut in as_completed(futures):
+                    cls._check_cancel()
+                    merge_totals(totals, fut.result())
 
-            except Exception:
-                continue
+            except CancelledError:
+                raise CycleCancelled()
 
-            items = payload.get("items")
-            if not isinstance(items, list):
-                continue
+            except BrokenProcessPool:
+                # A worker died, start over with fresh ones next time
+                cls._pool = None
+                raise
 
-            for it in items:
-                if not isinstance(it, dict):
-                    continue
+            finally:
+                for fut in futures:
+                    fut.cancel()
 
-                item_id = it.get("id")
-                if not item_id:
-                    continue
+        return [
+            {"id": iid, "count": cnt}
+            for iid, cnt in sorted(totals.items(), key=lambda x: (-x[1], x[0]))
+        ]
 
-                cnt_raw = it.get("count", 1)
-                try:
-                    cnt = int(cnt_raw)
+    @staticmethod
+    def _totals_digest(merged_list: list[dict]) -> str:
+        raw = json.dumps(merged_list, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-                except Exception:
-                    cnt = 1
+    @classmethod
+    def _latest_snapshot_digest(cls) -> str | None:
+        """Totals digest of the newest snapshot on disk, to survive restarts."""
+        snaps = sorted(cls.SNAPSHOT_DIR.glob("inv_*.json"))
+        if not snaps:
+            return None
 
-                totals[item_id] = totals.get(item_id, 0) + cnt
+        try:
+            with snaps[-1].open(encoding="utf-8") as f:
+                return cls._totals_digest(json.load(f).get("inventory", []))
 
-        merged_list = [
-            {"id": iid, "count": cnt}
-            for iid, cnt in sorted(totals.items(), key=lambda x: (-x[1], x[0]))
-        ]
+        except Exception as e:
+            logger.warning("Economy: cannot read %s: %s", snaps[-1].name, e)
+            return None
 
+    @classmethod
+    def _drop_json(cls, merged_list: list[dict]) -> Path:
         cls.JSON_PATH.parent.mkdir(parents=True, exist_ok=True)
         with open(cls.JSON_PATH, "w", encoding="utf-8") as f:
             json.dump({"inventory": merged_list}, f, ensure_ascii=False, indent=4)
@@ -94,32 +229,216 @@ class GameDBProcessor:
         return cls.JSON_PATH
 
     @classmethod
-    def _delete_db(cls) -> None:
-        if cls.DB_PATH.exists():
-            cls.DB_PATH.unlink()
+    def last_cycle(cls) -> dict:
+        return dict(cls._last_cycle)
+
+    @classmethod
+    def stats(cls) -> dict:
+        counters = dict(cls._counters)
+        counters["skipped"] = sum(v for k, v in counters.items() if k != "produced")
+        return {
+            "snapshots": counters,
+            "runs": dict(cls._runs),
+            "last_cycle": cls.last_cycle(),
+        }
+
+    @classmethod
+    def _check_cancel(cls) -> None:
+        if cls._stop.is_set():
+            raise CycleCancelled()
 
     @classmethod
-    def create_json(cls) -> Path:
-        cls.download_db()
-        cls._cleanup_db()
-        cls._drop_json()
-        cls._delete_db()
+    def _finish(cls, t0: float, outcome: str, metrics: dict) -> None:
+        cls._counters[outcome] += 1
+        metrics["outcome"] = outcome
+        metrics["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        cls._last_cycle = metrics
+        if outcome != "produced":
+            logger.info(
+                "Economy snapshot %s, %s ms (%s produced, %s skipped so far)",
+                outcome,
+                metrics["total_ms"],
+                cls._counters["produced"],
+                sum(v for k, v in cls._counters.items() if k != "produced"),
+            )
 
-        ts = datetime.now(UTC).strftime("%Y%m%d_%H%M%S")
-        snap_path = cls.JSON_PATH.parent / "snapshots" / f"inv_{ts}.json"
+    @classmethod
+    def create_json(cls) -> Path | None:
+        """Write a new snapshot, or None if nothing changed since the last one.
+
+        Unchanged database files are not read at all, unchanged inventory
+        rows are not parsed, and equal totals are not written again.
+        """
+        t0 = time.perf_counter()
+        fingerprint = cls._source_fingerprint()
+        if fingerprint == cls._seen.get("fingerprint"):
+            cls._finish(t0, "skipped_source", {})
+            return None
+
+        rows, metrics = cls._read_inventory_rows()
+        rows_digest = cls._rows_digest(rows)
+        if rows_digest == cls._seen.get("rows"):
+            cls._seen["fingerprint"] = fingerprint
+            cls._finish(t0, "skipped_rows", metrics)
+            return None
+
+        merged_list = cls._aggregate(rows)
+        totals_digest = cls._totals_digest(merged_list)
+        if "totals" not in cls._seen:
+            cls._seen["totals"] = cls._latest_snapshot_digest()
+
+        metrics["items"] = len(merged_list)
+        if totals_digest == cls._seen["totals"]:
+            cls._seen.update(fingerprint=fingerprint, rows=rows_digest)
+            cls._finish(t0, "skipped_totals", metrics)
+            return None
+
+        cls._drop_json(merged_list)
+
+        now = datetime.now(UTC).replace(microsecond=0)
+        snap_path = cls.SNAPSHOT_DIR / f"inv_{now.strftime(cls._SNAPSHOT_TS)}.json"
         snap_path.parent.mkdir(parents=True, exist_ok=True)
         cls.JSON_PATH.rename(snap_path)
+        cls._seen.update(
+            fingerprint=fingerprint, rows=rows_digest, totals=totals_digest
+        )
+        try:
+            EconomyDB.add_snapshot(int(now.timestamp()), snap_path.name, merged_list)
+
+        except Exception as e:
+            # The file is on disk, ingest_snapshots() picks it up on restart
+            logger.warning("Economy: cannot store %s: %s", snap_path.name, e)
+
+        metrics["snapshot"] = snap_path.name
+        cls._finish(t0, "produced", metrics)
+        logger.info(
+            "Economy snapshot %s: %s rows, %s bytes read of %s, %s ms",
+            snap_path.name,
+            metrics["rows"],
+            metrics["bytes_read"],
+            metrics["source_bytes"],
+            metrics["total_ms"],
+        )
 
         return snap_path
 
     @classmethod
-    async def pull_db_data(cls):
-        while True:
+    def _cycle(cls) -> Path | None:
+        """Status check and snapshot, run in the executor thread."""
+        if not cls._cycle_lock.acquire(blocking=False):
+            cls._runs["overlaps"] += 1
+            logger.warning("Economy cycle still running, skipping this one")
+            return None
+
+        t0 = time.perf_counter()
+        try:
+            status = ServerControl.get_status()
+            cls._runs["last_status_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            if status is not ServerStatus.RUNNING:
+                return None
+
+            cls._runs["cycles"] += 1
+            return cls.create_json()
+
+        except CycleCancelled:
+            cls._runs["cancelled"] += 1
+            logger.info("Economy cycle cancelled")
+
+        except Exception as e:
+            cls._runs["failures"] += 1
+            cls._runs["last_error"] = str(e)
+            logger.warning("Economy snapshot failed: %s", e)
+
+        finally:
+            ms = round((time.perf_counter() - t0) * 1000, 1)
+            cls._runs["last_cycle_ms"] = ms
+            cls._runs["max_cycle_ms"] = max(cls._runs["max_cycle_ms"], ms)
+            cls._cycle_lock.release()
+            logger.info(
+                "Economy cycle took %s ms (status check %s ms, max %s ms)",
+                ms,
+                cls._runs["last_status_ms"],
+                cls._runs["max_cycle_ms"],
+            )
+
+        return None
+
+    @classmethod
+    async def run_cycle(cls) -> Path | None:
+        """Run one cycle off the event loop, unless one is already running."""
+        if cls._cycle_lock.locked():
+            cls._runs["overlaps"] += 1
+            logger.warning("Economy cycle still running, skipping this one")
+            return None
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls._executor, cls._cycle)
+
+    @classmethod
+    def stop(cls) -> None:
+        """Ask a running cycle to stop at its next batch boundary."""
+        cls._stop.set()
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """stop() and release the worker processes."""
+        cls.stop()
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=False, cancel_futures=True)
+            cls._pool = None
+
+    @classmethod
+    def _snapshot_ts(cls, name: str) -> int | None:
+        try:
+            dt = datetime.strptime(name[len("inv_") : -len(".json")], cls._SNAPSHOT_TS)
+
+        except ValueError:
+            return None
+
+        return int(dt.replace(tzinfo=UTC).timestamp())
+
+    @classmethod
+    def ingest_snapshots(cls) -> int:
+        """Store snapshot files EconomyDB does not have yet, return how many."""
+        known = EconomyDB.snapshot_names()
+        added = 0
+        for path in sorted(cls.SNAPSHOT_DIR.glob("inv_*.json")):
+            ts = cls._snapshot_ts(path.name)
+            if path.name in known or ts is None:
+                continue
+
             try:
-                if ServerControl.get_status() is ServerStatus.RUNNING:
-                    cls.create_json()
+                with path.open(encoding="utf-8") as f:
+                    items = json.load(f).get("inventory", [])
+
+            except Exception as e:
+                logger.warning("Economy: cannot ingest %s: %s", path.name, e)
+                continue
+
+            if EconomyDB.add_snapshot(ts, path.name, items):
+                added += 1
+
+        if added:
+            logger.info("Economy: ingested %s snapshot files", added)
+
+        return added
+
+    @classmethod
+    async def pull_db_data(cls, interval_sec: float | None = None):
+        cls._stop.clear()
+        interval = cls.INTERVAL_SEC if interval_sec is None else interval_sec
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                await loop.run_in_executor(cls._executor, cls.ingest_snapshots)
+
+            except Exception as e:
+                logger.warning("Economy snapshot ingestion failed: %s", e)
 
-            except Exception:
-                pass
+            while not cls._stop.is_set():
+                await cls.run_cycle()
+                await asyncio.sleep(interval)
 
-            await asyncio.sleep(60 * 15)
+        except asyncio.CancelledError:
+            cls.stop()
+            raise
@@ -0,0 +1,52 @@
+import json
+
+import orjson
+
+
+def add_inventory(totals: dict[str, int], json_str: str) -> None:
+    """Add the item counts of one character's inventory JSON to totals."""
+    try:
+        payload = orjson.loads(json_str)
+
+    except orjson.JSONDecodeError:
+        # orjson is stricter (NaN, integers past 64 bits), keep what json takes
+        try:
+            payload = json.loads(json_str)
+
+        except Exception:
+            return
+
+    items = payload.get("items") if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        return
+
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+
+        item_id = it.get("id")
+        if not item_id:
+            continue
+
+        cnt_raw = it.get("count", 1)
+        try:
+            cnt = int(cnt_raw)
+
+        except Exception:
+            cnt = 1
+
+        totals[item_id] = totals.get(item_id, 0) + cnt
+
+
+def aggregate_chunk(rows: list[str]) -> dict[str, int]:
+    """Partial totals of a chunk of rows; runs in the worker processes."""
+    totals: dict[str, int] = {}
+    for json_str in rows:
+        add_inventory(totals, json_str)
+
+    return totals
+
+
+def merge_totals(totals: dict[str, int], partial: dict[str, int]) -> None:
+    for item_id, cnt in partial.items():
+        totals[item_id] = totals.get(item_id, 0) + cnt
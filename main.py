@@ -8,9 +8,15 @@ from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
-from data_bases import PaymentServiceDB
+from data_bases import (
+    ConnectionPool,
+    EconomyDB,
+    PaymentServiceDB,
+    VanityCacheDB,
+    WorkshopCacheDB,
+)
 from data_class import ProfileDataBase
-from data_control import AutoTax, Config
+from data_control import AutoTax, Config, HttpClient
 from economy import GameDBProcessor
 from routers.api.yoomoney import router as api_yoomoney
 from routers.api_v2.oauth2 import router as api_v2_oauth2
@@ -30,10 +36,14 @@ REQUIRED_AGENT = "spf-agent-v2"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    economy_task: asyncio.Task | None = None
     try:
         Config.load()
         Constant.load()
         PaymentServiceDB.create_db_table()
+        WorkshopCacheDB.create_db_table()
+        VanityCacheDB.create_db_table()
+        EconomyDB.create_db_table()
         ProfileDataBase.setup_db()
 
         try:
@@ -42,13 +52,20 @@ async def lifespan(app: FastAPI):
         except Exception as err:
             logging.error(f"AutoTax setup fail: {err}")
 
-        asyncio.create_task(GameDBProcessor.pull_db_data())
-        asyncio.create_task(AutoTax.run_queue_worker(interval_sec=60))
+        economy_task = asyncio.create_task(GameDBProcessor.pull_db_data())
+        asyncio.create_task(AutoTax.run_queue_worker(interval_sec=60, concurrency=4))
 
         yield
 
     finally:
-        pass
+        GameDBProcessor.shutdown()
+        if economy_task is not None:
+            economy_task.cancel()
+            await asyncio.gather(economy_task, return_exceptions=True)
+
+        ConnectionPool.close_all()
+        HttpClient.close()
+        await HttpClient.aclose()
 
 
 app = FastAPI(
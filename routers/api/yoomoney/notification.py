@@ -66,6 +66,8 @@ def _match_scenario(
 
 
 def _ensure_tax_receipt(payment_id: str, payment) -> None:
+    # Must run after the payment is stored as "done": the receipt itself is
+    # issued by the AutoTax queue worker, off the webhook request.
     if getattr(payment, "tax_check_id", None):
         AutoTax.remove_from_queue(payment_id)
         return
@@ -75,14 +77,8 @@ def _ensure_tax_receipt(payment_id: str, payment) -> None:
         logger.error("Payment %s has no services for tax receipt", payment_id)
         return
 
-    try:
-        tax_uuid = AutoTax.post_income(services)
-        payment.tax_check_id = tax_uuid
-        AutoTax.remove_from_queue(payment_id)
-
-    except Exception as exc:
-        logger.error("AutoTax.post_income failed for %s: %s", payment_id, exc)
-        AutoTax.enqueue_income(payment_id, services)
+    AutoTax.enqueue_income(payment_id, services)
+    AutoTax.notify_queue()
 
 
 @router.post("/notification", response_class=PlainTextResponse)
@@ -144,8 +140,8 @@ def yoomoney_notification(
             payment.payer_amount = withdraw_dec
 
     if payment.status == "done":
-        _ensure_tax_receipt(payment_id, payment)
         PaymentServiceDB.upsert_payment(payment_id, payment)
+        _ensure_tax_receipt(payment_id, payment)
         return PlainTextResponse("OK", status_code=200)
 
     if payment.status in ("declined", "cancelled"):
@@ -181,8 +177,8 @@ def yoomoney_notification(
     payment.status = "done"
     logger.info("Payment %s matched scenario: %s", payment_id, scenario)
 
-    _ensure_tax_receipt(payment_id, payment)
     PaymentServiceDB.upsert_payment(payment_id, payment)
+    _ensure_tax_receipt(payment_id, payment)
 
     return PlainTextResponse("OK", status_code=200)
 
@@ -234,8 +230,8 @@ def revalidate(payment_id: str, apply: bool) -> dict:
 
     if matched and apply:
         payment.status = "done"
-        _ensure_tax_receipt(payment_id, payment)
         PaymentServiceDB.upsert_payment(payment_id, payment)
+        _ensure_tax_receipt(payment_id, payment)
         result["status_after"] = payment.status
         result["applied"] = True
     else:
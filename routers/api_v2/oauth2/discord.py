@@ -1,12 +1,13 @@
+import asyncio
+import logging
 from urllib.parse import urlencode
 
-import requests
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
 from fastapi.responses import RedirectResponse
 
 import utils.jwt
 from data_class import ProfileDataBase
-from data_control import Config
+from data_control import Config, HttpClient
 
 CLIENT_SECRET = Config.discord_app()
 REDIRECT_URI = "https://spf-base.ru/api_v2/oauth2/discord/callback"
@@ -14,23 +15,35 @@ REDIRECT_URI = "https://spf-base.ru/api_v2/oauth2/discord/callback"
 BOT_TOKEN = Config.discord_bot()
 GUILD_ID = str(Config.discord_guild_id())
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def _join_guild(user_id: str, access_token: str) -> int:
+async def _join_guild(user_id: str, access_token: str) -> None:
+    """Add the user to the guild; runs after the login redirect is sent."""
     url = f"https://discord.com/api/v10/guilds/{GUILD_ID}/members/{user_id}"
     payload = {"access_token": access_token}
 
-    r = requests.put(
-        url,
-        headers={
-            "Authorization": f"Bot {BOT_TOKEN}",
-            "Content-Type": "application/json",
-        },
-        json=payload,
-        timeout=10,
-    )
-    return r.status_code
+    try:
+        r = await HttpClient.aput(
+            "discord",
+            url,
+            headers={
+                "Authorization": f"Bot {BOT_TOKEN}",
+                "Content-Type": "application/json",
+            },
+            json=payload,
+        )
+        if r.status_code not in (201, 204):
+            logger.warning(
+                "Discord guild join for %s failed: %s %s",
+                user_id,
+                r.status_code,
+                r.text[:200],
+            )
+
+    except Exception as e:
+        logger.warning("Discord guild join for %s failed: %s", user_id, e)
 
 
 @router.get("/discord/login")
@@ -48,12 +61,51 @@ def discord_login():
     return RedirectResponse(f"https://discord.com/api/oauth2/authorize?{query}")
 
 
+def _login_profile(old: dict | None, discord_id: str, username: str | None) -> str:
+    """Find, create or link the profile of a Discord login; blocking DB calls."""
+    if not old:
+        profile = ProfileDataBase.get_profile_by_discord(discord_id)
+        if profile is None:
+            p_uuid = ProfileDataBase.create_profile(discord_id=discord_id)
+            stored_name = None
+        else:
+            p_uuid = profile.get("uuid")
+            stored_name = profile.get("username")
+    else:
+        uuid = old.get("uuid")
+        if not uuid:
+            raise HTTPException(400, "Invalid session: missing uuid")
+
+        profile = ProfileDataBase.get_profile_by_uuid(uuid)
+        if not profile:
+            raise HTTPException(400, "Profile not found")
+
+        if profile.get("discord_id"):
+            raise HTTPException(400, "Discord account already linked")
+
+        ProfileDataBase.update_profile(uuid, discord_id=discord_id)
+        p_uuid = uuid
+        stored_name = profile.get("username")
+
+    if not p_uuid:
+        raise HTTPException(500, "Profile has no uuid")
+
+    # Only write on a rename: every update reindexes and invalidates caches
+    if username and username != stored_name:
+        ProfileDataBase.update_profile(p_uuid, username=username)
+
+    return p_uuid
+
+
 @router.get("/discord/callback")
-def discord_callback(request: Request, code: str | None = None):
+async def discord_callback(
+    request: Request, background: BackgroundTasks, code: str | None = None
+):
     if not code:
         raise HTTPException(400, "Missing code")
 
-    token_resp = requests.post(
+    token_resp = await HttpClient.apost(
+        "discord",
         "https://discord.com/api/oauth2/token",
         data={
             "client_id": "1370825296839839795",
@@ -63,7 +115,6 @@ def discord_callback(request: Request, code: str | None = None):
             "redirect_uri": REDIRECT_URI,
         },
         headers={"Content-Type": "application/x-www-form-urlencoded"},
-        timeout=10,
     )
     if token_resp.status_code != 200:
         raise HTTPException(400, "Failed to exchange code")
@@ -72,43 +123,23 @@ def discord_callback(request: Request, code: str | None = None):
     if not access_token:
         raise HTTPException(400, "No access token")
 
-    me_resp = requests.get(
+    me_resp = await HttpClient.aget(
+        "discord",
         "https://discord.com/api/users/@me",
         headers={"Authorization": f"Bearer {access_token}"},
-        timeout=10,
     )
     if me_resp.status_code != 200:
         raise HTTPException(400, "Failed to fetch user profile")
 
     me = me_resp.json()
 
-    join_status = _join_guild(me["id"], access_token)
-    if join_status not in (201, 204):
-        pass
+    background.add_task(_join_guild, me["id"], access_token)
 
     token = request.cookies.get("session")
     old = utils.jwt.decode(token) if token else None
 
-    if not old:
-        p_uuid = ProfileDataBase.get_profile_by_discord(me["id"])
-        if p_uuid is None:
-            p_uuid = ProfileDataBase.create_profile(discord_id=me["id"])
-        else:
-            p_uuid = p_uuid.get("uuid")
-    else:
-        uuid = old.get("uuid")
-        if not uuid:
-            raise HTTPException(400, "Invalid session: missing uuid")
-
-        profile = ProfileDataBase.get_profile_by_uuid(uuid)
-        if not profile:
-            raise HTTPException(400, "Profile not found")
-
-        if profile.get("discord_id"):
-            raise HTTPException(400, "Discord account already linked")
-
-        ProfileDataBase.update_profile(uuid, discord_id=me["id"])
-        p_uuid = uuid
+    username = me.get("global_name") or me.get("username")
+    p_uuid = await asyncio.to_thread(_login_profile, old, me["id"], username)
 
     jwt_token = utils.jwt.create({"uuid": p_uuid})
 
@@ -1,11 +1,12 @@
+import asyncio
 from urllib.parse import urlencode
 
-import requests
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import RedirectResponse
 
 import utils.jwt
 from data_class import ProfileDataBase
+from data_control import HttpClient
 
 REDIRECT_URI = "https://spf-base.ru/api_v2/oauth2/steam/callback"
 STEAM_OPENID = "https://steamcommunity.com/openid/login"
@@ -28,31 +29,14 @@ def steam_login():
     return RedirectResponse(f"{STEAM_OPENID}?{query}")
 
 
-@router.get("/steam/callback")
-def steam_callback(request: Request):
-    params = dict(request.query_params)
-    verify = params.copy()
-    verify["openid.mode"] = "check_authentication"
-
-    resp = requests.post(STEAM_OPENID, data=verify, timeout=10)
-    if resp.status_code != 200 or "is_valid:true" not in resp.text:
-        raise HTTPException(400, "Failed to verify OpenID response")
-
-    claimed_id = params.get("openid.claimed_id")
-    if not claimed_id:
-        raise HTTPException(400, "Missing claimed_id")
-
-    steam_id = claimed_id.rsplit("/", 1)[-1]
-
-    token = request.cookies.get("session")
-    old = utils.jwt.decode(token) if token else None
-
+def _login_profile(old: dict | None, steam_id: str) -> str:
+    """Find, create or link the profile of a Steam login; blocking DB calls."""
     if not old:
-        p_uuid = ProfileDataBase.get_profile_by_steam(steam_id)
-        if p_uuid is None:
+        profile = ProfileDataBase.get_profile_by_steam(steam_id)
+        if profile is None:
             p_uuid = ProfileDataBase.create_profile(steam_id=steam_id)
         else:
-            p_uuid = p_uuid.get("uuid")
+            p_uuid = profile.get("uuid")
     else:
         uuid = old.get("uuid")
         if not uuid:
@@ -68,6 +52,33 @@ def steam_callback(request: Request):
         ProfileDataBase.update_profile(uuid, steam_id=steam_id)
         p_uuid = uuid
 
+    if not p_uuid:
+        raise HTTPException(500, "Profile has no uuid")
+
+    return p_uuid
+
+
+@router.get("/steam/callback")
+async def steam_callback(request: Request):
+    params = dict(request.query_params)
+    verify = params.copy()
+    verify["openid.mode"] = "check_authentication"
+
+    resp = await HttpClient.apost("steam_community", STEAM_OPENID, data=verify)
+    if resp.status_code != 200 or "is_valid:true" not in resp.text:
+        raise HTTPException(400, "Failed to verify OpenID response")
+
+    claimed_id = params.get("openid.claimed_id")
+    if not claimed_id:
+        raise HTTPException(400, "Missing claimed_id")
+
+    steam_id = claimed_id.rsplit("/", 1)[-1]
+
+    token = request.cookies.get("session")
+    old = utils.jwt.decode(token) if token else None
+
+    p_uuid = await asyncio.to_thread(_login_profile, old, steam_id)
+
     jwt_token = utils.jwt.create({"uuid": p_uuid})
 
     resp = RedirectResponse("/profile")
@@ -1,44 +1,53 @@
-import json
-from pathlib import Path
+from datetime import UTC, date, datetime, time, timedelta
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, Query, Request
 
 import utils.admin
+from data_bases import EconomyDB
 from templates import templates
 
 router = APIRouter()
 
-
-def load_currency_series() -> dict[str, list[tuple[str, int]]]:
-    series: dict[str, list[tuple[str, int]]] = {}
-    snaps = sorted((Path("data/snapshots")).glob("inv_*.json"))
-
-    for snap in snaps:
-        ts = snap.stem.split("_", 1)[1]
-        with snap.open(encoding="utf-8") as f:
-            data = json.load(f)
-
-        for item in data.get("inventory", []):
-            iid, cnt = item.get("id"), int(item.get("count", 0))
-            if not iid:
-                continue
-
-            if not (iid.startswith("currency_") or iid.startswith("ammo_")):
-                continue
-
-            series.setdefault(iid, []).append((ts, cnt))
-
-    for iid in series:
-        series[iid].sort(key=lambda p: p[0])
-
-    return series
-
-
-@router.get("/economy")
-def economy(request: Request):
-    utils.admin.require_access(request, "panel_access")
-
-    series = load_currency_series()
+DEFAULT_PREFIXES = ("ammo_", "currency_")
+DEFAULT_DAYS = 30
+
+
+def load_series(
+    items: list[str], since: date, until: date
+) -> dict[str, list[tuple[str, int]]]:
+    """Points of the given items within [since, until], labelled by snapshot."""
+    start = int(datetime.combine(since, time.min, UTC).timestamp())
+    end = int(datetime.combine(until, time.max, UTC).timestamp())
+    return {
+        item_id: [
+            (datetime.fromtimestamp(ts, UTC).strftime("%Y%m%d_%H%M%S"), cnt)
+            for ts, cnt in points
+        ]
+        for item_id, points in EconomyDB.series(items, start, end).items()
+    }
+
+
+@router.get(
+    "/economy", dependencies=[Depends(utils.admin.RequireAccess("panel_access"))]
+)
+def economy(
+    request: Request,
+    items: list[str] = Query([]),
+    since: date | None = None,
+    until: date | None = None,
+):
+    until = until or datetime.now(UTC).date()
+    since = since or until - timedelta(days=DEFAULT_DAYS)
+    items = [i for i in items if i] or EconomyDB.item_ids(DEFAULT_PREFIXES)
+
+    series = load_series(items, since, until)
     return templates.TemplateResponse(
-        "economy.html", {"request": request, "series": series}
+        "economy.html",
+        {
+            "request": request,
+            "series": series,
+            "items": items,
+            "since": since.isoformat(),
+            "until": until.isoformat(),
+        },
     )
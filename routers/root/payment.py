@@ -3,7 +3,12 @@ from typing import Literal
 from urllib.parse import quote, urlencode
 
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import HTMLResponse, RedirectResponse, Response
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    RedirectResponse,
+    Response,
+)
 
 from data_bases import PaymentServiceDB
 from data_control import AutoTax, Config
@@ -126,10 +131,12 @@ def download_receipt_png(request: Request, payment_uuid: str):
     if not tax_uuid:
         raise HTTPException(status_code=404, detail="tax check id is missing")
 
+    etag = f'"{tax_uuid}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
     try:
-        content = AutoTax.get_check_png(tax_uuid)
-        if not isinstance(content, (bytes, bytearray)):
-            raise RuntimeError("receipt content is not bytes")
+        path = AutoTax.get_check_png_path(tax_uuid)
 
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"failed to fetch receipt: {e}")
@@ -139,8 +146,11 @@ def download_receipt_png(request: Request, payment_uuid: str):
 
     disp = f"attachment; filename={filename_ascii}; filename*=UTF-8''{quote(filename_utf8)}"
 
+    # A receipt never changes once issued, so browsers may keep it forever
     headers = {
         "Content-Disposition": disp,
         "X-Content-Type-Options": "nosniff",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=31536000, immutable",
     }
-    return Response(content, media_type="image/png", headers=headers)
+    return FileResponse(path, media_type="image/png", headers=headers)
@@ -3,14 +3,14 @@ import logging
 import re
 from pathlib import Path
 
-from fastapi import APIRouter, Form, Request
+from fastapi import APIRouter, Depends, Form, Request
 from fastapi.responses import RedirectResponse
 
 import utils.admin
 import utils.error
 from templates import templates
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(utils.admin.RequireAccess("edit_lore_chars"))])
 logger = logging.getLogger(__name__)
 
 LORE_CHAR_DATA = Path("data/lore_char.json")
@@ -49,7 +49,6 @@ def next_id(chars: dict) -> str:
 
 @router.get("/profile/admin/lore_chars")
 async def admin_lore_chars(request: Request):
-    utils.admin.require_access(request, "edit_lore_chars")
     chars = load_chars()
 
     items = [
@@ -76,8 +75,6 @@ async def lore_char_create(
     wiki: str = Form(""),
     status: str = Form("free"),
 ):
-    utils.admin.require_access(request, "edit_lore_chars")
-
     clean_name = (name or "").strip()
     if not clean_name:
         utils.error.bad_request("char_name_empty", "Character name cannot be empty")
@@ -106,8 +103,6 @@ async def lore_char_update(
     wiki: str = Form(""),
     status: str = Form("free"),
 ):
-    utils.admin.require_access(request, "edit_lore_chars")
-
     chars = load_chars()
     if char_id not in chars:
         utils.error.not_found("char_not_found", "Character not found", char_id=char_id)
@@ -134,8 +129,6 @@ async def lore_char_update(
 
 @router.post("/profile/admin/lore_char/delete")
 async def lore_char_delete(request: Request, char_id: str = Form(...)):
-    utils.admin.require_access(request, "edit_lore_chars")
-
     chars = load_chars()
     if char_id in chars:
         chars.pop(char_id)
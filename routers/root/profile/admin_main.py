@@ -1,8 +1,10 @@
 import logging
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, Request
 
 import utils.admin
+from data_control import HttpClient
+from economy import GameDBProcessor
 from templates import templates
 
 router = APIRouter()
@@ -11,9 +13,33 @@ logging.basicConfig(level=logging.INFO)
 
 
 @router.get("/profile/admin")
-async def profile_admin_home(request: Request):
-    admin = utils.admin.require_admin(request)
+async def profile_admin_home(
+    request: Request, admin: dict = Depends(utils.admin.RequireAccess())
+):
     return templates.TemplateResponse(
         "profile/admin/index.html",
         {"request": request, "authenticated": True, "profile": admin},
     )
+
+
+@router.get(
+    "/profile/admin/http_metrics", dependencies=[Depends(utils.admin.RequireAccess())]
+)
+async def profile_admin_http_metrics():
+    return HttpClient.metrics()
+
+
+@router.get(
+    "/profile/admin/economy_metrics",
+    dependencies=[Depends(utils.admin.RequireAccess())],
+)
+async def profile_admin_economy_metrics():
+    return GameDBProcessor.stats()
+
+
+@router.get(
+    "/profile/admin/session_metrics",
+    dependencies=[Depends(utils.admin.RequireAccess())],
+)
+async def profile_admin_session_metrics():
+    return utils.admin.SessionCache.stats()
@@ -1,8 +1,10 @@
 import logging
 import uuid
-from typing import Literal
+from datetime import UTC, datetime, timedelta
+from typing import Literal, get_args
+from urllib.parse import urlencode
 
-from fastapi import APIRouter, Form, Request
+from fastapi import APIRouter, Depends, Form, Request
 from fastapi.responses import RedirectResponse
 
 import utils.admin
@@ -14,17 +16,18 @@ from data_bases import (
     PaymentServiceDB,
     ServiceSnapshot,
 )
-from data_bases import (
-    Service as ServiceModel,
-)
+from data_control import AutoTax
 from templates import templates
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(utils.admin.RequireAccess("edit_payments"))])
 
 PaymentStatus = Literal["pending", "declined", "cancelled", "done"]
 CommissionKey = Literal["PC", "AC"]
 
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 
 def _build_snapshots(items: list[dict]) -> list[ServiceSnapshot]:
     if not isinstance(items, list) or not items:
@@ -47,35 +50,12 @@ def _build_snapshots(items: list[dict]) -> list[ServiceSnapshot]:
 
         want[svc_id] = want.get(svc_id, 0) + qty
 
-    cache: dict[str, ServiceModel] = {}
-    for svc_id, qty in want.items():
-        svc = PaymentServiceDB.get_service(svc_id)
-        if not svc:
-            raise ValueError(f"Service not found: {svc_id}")
-
-        if svc.status != "on":
-            raise ValueError(f"Service is not active: {svc_id}")
-
-        if svc.left is not None and svc.left < qty:
-            raise ValueError(
-                f"Not enough stock for {svc_id}: need {qty}, left {svc.left}"
-            )
-
-        cache[svc_id] = svc
-
-    decremented: list[tuple[str, int]] = []
-    try:
-        for svc_id, qty in want.items():
-            if not PaymentServiceDB.decrement_service_left(svc_id, qty):
-                raise ValueError(f"Failed to decrement stock for {svc_id}")
-
-            decremented.append((svc_id, qty))
-
-    except Exception:
-        for svc_id, qty in reversed(decremented):
-            PaymentServiceDB.increment_service_left(svc_id, qty)
-
-        raise
+    cache, failed = PaymentServiceDB.reserve_services(want)
+    if failed:
+        raise ValueError(
+            "Cannot reserve: "
+            + ", ".join(f"{svc_id} ({reason})" for svc_id, reason in failed.items())
+        )
 
     snaps: list[ServiceSnapshot] = []
     for svc_id, qty in want.items():
@@ -95,23 +75,74 @@ def _build_snapshots(items: list[dict]) -> list[ServiceSnapshot]:
     return snaps
 
 
+def _snapshot_counts(pay: PaymentModel) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for snap in pay.snapshot:
+        if snap.service_u_id:
+            counts[snap.service_u_id] = counts.get(snap.service_u_id, 0) + 1
+
+    return counts
+
+
+def _parse_cursor(raw: str | None) -> tuple[str, int] | None:
+    if not raw:
+        return None
+
+    created_at, _, row_id = raw.rpartition("|")
+    if not created_at or not row_id.isdigit():
+        utils.error.bad_request("cursor_invalid", "Invalid page cursor", cursor=raw)
+
+    return created_at, int(row_id)
+
+
+def _parse_day(raw: str | None, name: str) -> datetime | None:
+    if not raw:
+        return None
+
+    try:
+        return datetime.strptime(raw, "%Y-%m-%d").replace(tzinfo=UTC)
+
+    except ValueError:
+        utils.error.bad_request(f"{name}_invalid", "Date must be YYYY-MM-DD", value=raw)
+
+
 @router.get("/profile/admin/payments")
 async def admin_payments(request: Request):
-    utils.admin.require_access(request, "edit_payments")
+    qp = request.query_params
+    try:
+        limit = int(qp.get("limit") or PAGE_SIZE)
 
-    rows = list(PaymentServiceDB.list_payments())
+    except ValueError:
+        limit = PAGE_SIZE
 
-    def _sort_key(row: tuple[str, PaymentModel]):
-        pay = row[1]
-        return (
-            getattr(pay, "creation_date", None) or getattr(pay, "created_at", None) or 0
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    status = qp.get("status") or None
+    if status is not None and status not in get_args(PaymentStatus):
+        utils.error.bad_request(
+            "status_invalid", "Unknown payment status", value=status
         )
 
-    try:
-        rows.sort(key=_sort_key, reverse=True)
+    filters = {
+        "status": status or "",
+        "player_id": (qp.get("player_id") or "").strip(),
+        "date_from": qp.get("date_from") or "",
+        "date_to": qp.get("date_to") or "",
+        "no_tax": qp.get("no_tax") == "1",
+    }
 
-    except Exception:
-        pass
+    date_from = _parse_day(filters["date_from"], "date_from")
+    date_to = _parse_day(filters["date_to"], "date_to")
+
+    rows, next_cursor = PaymentServiceDB.list_payments_page(
+        limit,
+        before=_parse_cursor(qp.get("cursor")),
+        status=status,
+        player_id=filters["player_id"] or None,
+        created_from=date_from,
+        created_to=date_to + timedelta(days=1) if date_to else None,
+        missing_tax_check=filters["no_tax"],
+    )
 
     payments = []
     for u_id, pay in rows:
@@ -121,6 +152,11 @@ async def admin_payments(request: Request):
                 "status": pay.status,
                 "player_id": pay.player_id,
                 "commission_key": pay.commission_key,
+                "created_at": (
+                    pay.created_at.strftime("%Y-%m-%d %H:%M")
+                    if pay.created_at
+                    else None
+                ),
                 "snapshot_len": len(pay.snapshot),
                 "snapshot": [s.to_dict() for s in pay.snapshot],
                 "total": f"{pay.total():.2f}",
@@ -136,6 +172,13 @@ async def admin_payments(request: Request):
             }
         )
 
+    base_query = {k: v for k, v in qp.items() if k not in ("cursor", "created_id")}
+    first_url = f"/profile/admin/payments?{urlencode(base_query)}"
+    next_url = None
+    if next_cursor:
+        next_query = {**base_query, "cursor": f"{next_cursor[0]}|{next_cursor[1]}"}
+        next_url = f"/profile/admin/payments?{urlencode(next_query)}"
+
     svc_rows = PaymentServiceDB.list_services()
     services = []
     for u, svc in svc_rows:
@@ -161,10 +204,19 @@ async def admin_payments(request: Request):
             "payments": payments,
             "services": services,
             "created_id": created_id,
+            "filters": filters,
+            "statuses": get_args(PaymentStatus),
+            "next_url": next_url,
+            "first_url": first_url if qp.get("cursor") else None,
         },
     )
 
 
+@router.get("/profile/admin/payments/tax_queue")
+async def admin_tax_queue(request: Request):
+    return AutoTax.queue_metrics()
+
+
 @router.post("/profile/admin/payment/create")
 async def payment_create(
     request: Request,
@@ -174,8 +226,6 @@ async def payment_create(
     service_u_id: list[str] = Form(...),
     qty: list[int] = Form(...),
 ):
-    utils.admin.require_access(request, "edit_payments")
-
     if len(service_u_id) != len(qty):
         utils.error.bad_request("invalid_items", "Mismatched items arrays")
 
@@ -204,7 +254,12 @@ async def payment_create(
         payer_amount=None,
     )
     u_id = uuid.uuid4().hex
-    PaymentServiceDB.upsert_payment(u_id, pay)
+    try:
+        PaymentServiceDB.upsert_payment(u_id, pay)
+
+    except Exception:
+        PaymentServiceDB.release_services(_snapshot_counts(pay))
+        raise
 
     return RedirectResponse(
         f"/profile/admin/payments?created_id={u_id}",
@@ -220,8 +275,6 @@ async def payment_update(
     player_id: str | None = Form(None),
     commission_key: CommissionKey | None = Form(None),
 ):
-    utils.admin.require_access(request, "edit_payments")
-
     pay = PaymentServiceDB.get_payment(u_id)
     if not pay:
         utils.error.not_found("payment_not_found", "Payment not found", u_id=u_id)
@@ -237,14 +290,9 @@ async def payment_update(
 
     if status is not None and status != pay.status:
         if old_status == "pending" and status in ("cancelled", "declined"):
-            restored = 0
-            for snap in pay.snapshot:
-                svc_id = getattr(snap, "service_u_id", None)
-                if svc_id:
-                    PaymentServiceDB.increment_service_left(svc_id, 1)
-                    restored += 1
-
-            logger.info("Restored %d items for %s", restored, u_id)
+            counts = _snapshot_counts(pay)
+            PaymentServiceDB.release_services(counts)
+            logger.info("Restored %d items for %s", sum(counts.values()), u_id)
 
         pay.status = status
 
@@ -260,18 +308,13 @@ async def payment_update(
 
 @router.post("/profile/admin/payment/delete")
 async def payment_delete(request: Request, u_id: str = Form(...)):
-    utils.admin.require_access(request, "edit_payments")
-
     pay = PaymentServiceDB.get_payment(u_id)
     if not pay:
         utils.error.not_found("payment_not_found", "Payment not found", u_id=u_id)
         return
 
     if pay.status == "pending":
-        for snap in pay.snapshot:
-            svc_id = getattr(snap, "service_u_id", None)
-            if svc_id:
-                PaymentServiceDB.increment_service_left(svc_id, 1)
+        PaymentServiceDB.release_services(_snapshot_counts(pay))
 
     ok = PaymentServiceDB.delete_payment(u_id)
     if not ok:
@@ -1,15 +1,19 @@
 import asyncio
+import csv
+import io
+import json
 import logging
 import re
 from datetime import UTC, datetime
 from typing import Optional
 
-from fastapi import APIRouter, Form, Request
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
+from fastapi.responses import RedirectResponse, StreamingResponse
 
 import utils.admin
 import utils.error
 import utils.steam
+import utils.workshop
 from data_class import ProfileData, ProfileDataBase
 from templates import templates
 
@@ -17,6 +21,11 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 _URL_RE = re.compile(r"^https?://", re.IGNORECASE)
 
+PAGE_SIZE = 50
+NOTES_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+MAX_IMPORT_ROWS = 10000
+
 # Admin: labels
 ACCESS_FIELDS = {
     "full_access": "Полный доступ",
@@ -86,37 +95,26 @@ def _build_view_for_profile(p: dict, extra: Optional[dict]) -> dict:
             "base_char": _as_int(data.limits.get("base_char", 0)),
             "donate_char": _as_int(data.limits.get("donate_char", 0)),
         },
-        "notes": list(data.notes or []),
         "chars": list(data.chars or []),
     }
 
 
-def _matches_rough(p: dict, q: str) -> bool:
-    if not q:
-        return True
-
-    ql = q.lower()
-    for key in ("uuid", "discord_id", "steam_id"):
-        val = p.get(key) or ""
-        if isinstance(val, str) and ql in val.lower():
-            return True
-
-    uname = (p.get("username") or "").lower()
-    if uname and ql in uname:
-        return True
-
-    return False
-
-
-@router.get("/profile/admin/profiles")
-async def profile_admin_profiles(request: Request):
-    utils.admin.require_admin(request)
+def _search_views(request: Request) -> tuple[str, list[dict], int | None]:
     q = (request.query_params.get("q") or "").strip()
+    try:
+        limit = int(request.query_params.get("limit") or PAGE_SIZE)
 
-    profiles = ProfileDataBase.get_all_profiles()
-    prefiltered = [p for p in profiles if _matches_rough(p, q)]
+    except ValueError:
+        limit = PAGE_SIZE
 
-    light = [
+    after = request.query_params.get("cursor")
+    profiles, next_cursor = ProfileDataBase.search_profiles(
+        q,
+        limit=max(1, min(limit, MAX_PAGE_SIZE)),
+        after=int(after) if after and after.isdigit() else None,
+    )
+
+    views = [
         _build_view_for_profile(
             p,
             extra={
@@ -124,8 +122,16 @@ async def profile_admin_profiles(request: Request):
                 "avatar_url": p.get("avatar_url") or "/static/images/logo/discord.png",
             },
         )
-        for p in (prefiltered if q else profiles)
+        for p in profiles
     ]
+    return q, views, next_cursor
+
+
+@router.get(
+    "/profile/admin/profiles", dependencies=[Depends(utils.admin.RequireAccess())]
+)
+async def profile_admin_profiles(request: Request):
+    q, light, next_cursor = _search_views(request)
 
     return templates.TemplateResponse(
         "profile/admin/profiles.html",
@@ -134,29 +140,54 @@ async def profile_admin_profiles(request: Request):
             "authenticated": True,
             "users": light,
             "q": q,
+            "next_cursor": next_cursor,
             "ACCESS_FIELDS": ACCESS_FIELDS,
             "BLACKLIST_FIELDS": BLACKLIST_FIELDS,
         },
     )
 
 
-@router.get("/profile/admin/profiles/stream")
+@router.get(
+    "/profile/admin/profiles/stream",
+    dependencies=[Depends(utils.admin.RequireAccess())],
+)
 async def profile_admin_profiles_stream(request: Request):
-    utils.error.failed_dep(
-        "cog_unavailable", "UserControlCog.get_role_value is not available"
+    _, views, next_cursor = _search_views(request)
+
+    def lines():
+        for view in views:
+            yield json.dumps(view, ensure_ascii=False) + "\n"
+
+        yield json.dumps({"next_cursor": next_cursor}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get(
+    "/profile/admin/profile/notes",
+    dependencies=[Depends(utils.admin.RequireAccess())],
+)
+async def profile_admin_notes(
+    uuid: str,
+    before: int | None = None,
+    limit: int = NOTES_PAGE_SIZE,
+):
+    notes, next_cursor = ProfileDataBase.list_notes(
+        uuid, limit=max(1, min(limit, MAX_PAGE_SIZE)), before=before
     )
+    return {"notes": notes, "next_cursor": next_cursor}
 
 
 @router.post("/profile/admin/profile/update")
-async def profile_admin_update(request: Request):
-    admin = utils.admin.require_access(request, "edit_profiles")
-
+async def profile_admin_update(
+    request: Request, admin: dict = Depends(utils.admin.RequireAccess("edit_profiles"))
+):
     form = await request.form()
     uuid = (form.get("uuid") or "").strip()  # type: ignore
     if not uuid:
         utils.error.bad_request("uuid_required", "Missing profile uuid")
 
-    target = ProfileDataBase.get_profile_by_uuid(uuid)
+    target = utils.admin.load_profile(request, uuid)
     if not target:
         utils.error.not_found(
             "profile_utils.error.not_found", "Profile not found", uuid=uuid
@@ -216,8 +247,11 @@ async def profile_admin_update(request: Request):
 
 
 @router.post("/profile/admin/profile/delete")
-async def profile_admin_delete(request: Request, uuid: str = Form(...)):
-    admin = utils.admin.require_access(request, "edit_profiles")
+async def profile_admin_delete(
+    request: Request,
+    admin: dict = Depends(utils.admin.RequireAccess("edit_profiles")),
+    uuid: str = Form(...),
+):
     if admin.get("uuid") == uuid:  # type: ignore
         utils.error.bad_request(
             "cannot_delete_self", "Admin cannot delete their own profile", uuid=uuid
@@ -235,44 +269,33 @@ async def profile_admin_delete(request: Request, uuid: str = Form(...)):
     return RedirectResponse(url="/profile/admin/profiles", status_code=303)
 
 
-@router.post("/profile/admin/note/add")
+@router.post(
+    "/profile/admin/note/add",
+    dependencies=[Depends(utils.admin.RequireAccess("edit_notes"))],
+)
 async def profile_admin_note_add(
     request: Request,
     uuid: str = Form(...),
     content: str = Form(...),
     status: str = Form("info"),
 ):
-    utils.admin.require_access(request, "edit_notes")
-
-    target = ProfileDataBase.get_profile_by_uuid(uuid)
+    target = utils.admin.load_profile(request, uuid)
     if not target:
         utils.error.not_found(
             "profile_utils.error.not_found", "Profile not found", uuid=uuid
         )
 
-    data: ProfileData = target.get("data", ProfileData())  # type: ignore
-    if not isinstance(data, ProfileData):
-        utils.error.server_error(
-            "profile_data_invalid", "Profile data has invalid type", uuid=uuid
-        )
-
     content_clean = (content or "").strip()
     if not content_clean:
         utils.error.bad_request("note_empty", "Note content cannot be empty", uuid=uuid)
 
-    notes = data.notes
-    notes.insert(
-        0,
-        {
-            "date": datetime.now(tz=UTC).strftime("%Y-%m-%d %H:%M"),
-            "status": (status or "info").strip().lower(),
-            "content": content_clean,
-        },
-    )
-    data.notes = notes
-
     try:
-        ProfileDataBase.update_profile(uuid, data=data)
+        ProfileDataBase.add_note(
+            uuid,
+            content_clean,
+            status=(status or "info").strip().lower(),
+            date=datetime.now(tz=UTC).strftime("%Y-%m-%d %H:%M"),
+        )
 
     except Exception as e:
         logger.exception("update_profile (note) failed: %s", e)
@@ -283,7 +306,10 @@ async def profile_admin_note_add(
     return RedirectResponse(url="/profile/admin/profiles", status_code=303)
 
 
-@router.post("/profile/admin/char/add")
+@router.post(
+    "/profile/admin/char/add",
+    dependencies=[Depends(utils.admin.RequireAccess("edit_chars"))],
+)
 async def profile_admin_char_add(
     request: Request,
     uuid: str = Form(...),
@@ -291,54 +317,36 @@ async def profile_admin_char_add(
     discord_url: str = Form(""),
     steam_urls: str = Form(""),
 ):
-    utils.admin.require_access(request, "edit_chars")
-
-    target = ProfileDataBase.get_profile_by_uuid(uuid)
+    target = utils.admin.load_profile(request, uuid)
     if not target:
         utils.error.not_found(
             "profile_utils.error.not_found", "Profile not found", uuid=uuid
         )
 
-    data = target.get("data", ProfileData())  # type: ignore
-    if not isinstance(data, ProfileData):
-        utils.error.server_error(
-            "profile_data_invalid", "Profile data has invalid type", uuid=uuid
-        )
-
     clean_name = (name or "").strip()
     if not clean_name:
         utils.error.bad_request(
             "char_name_empty", "Character name cannot be empty", uuid=uuid
         )
 
-    ids: list[str] = []
-    for part in re.split(r"[\s,]+", (steam_urls or "").strip()):
-        m = re.search(r"[?&]id=(\d+)", part)
-        if m:
-            ids.append(m.group(1))
-
-    sizes = utils.steam.fetch_workshop_sizes(ids)
+    ids = utils.workshop.workshop_ids(re.split(r"[\s,]+", (steam_urls or "").strip()))
+    sizes = await asyncio.to_thread(utils.steam.fetch_workshop_sizes, ids)
     total_size = sum(sizes.values())
     total_mb = round(total_size / 1024 / 1024, 2)
 
-    entry = {
-        "name": clean_name,
-        "discord_url": (discord_url or "").strip()
-        if _URL_RE.match(discord_url or "")
-        else "",
-        "steam_urls": [
-            f"https://steamcommunity.com/sharedfiles/filedetails/?id={i}" for i in ids
-        ],
-        "weight_mb": total_mb,
-    }
-
-    chars = data.chars
-    chars.append(entry)
-    data.chars = chars
-    data.limits["used"] = round(sum(ch.get("weight_mb", 0) for ch in chars), 2)
-
     try:
-        ProfileDataBase.update_profile(uuid, data=data)
+        ProfileDataBase.add_char(
+            uuid,
+            clean_name,
+            discord_url=(
+                (discord_url or "").strip() if _URL_RE.match(discord_url or "") else ""
+            ),
+            steam_urls=[
+                f"https://steamcommunity.com/sharedfiles/filedetails/?id={i}"
+                for i in ids
+            ],
+            weight_mb=total_mb,
+        )
 
     except Exception as e:
         logger.exception("update_profile (char) failed: %s", e)
@@ -351,37 +359,17 @@ async def profile_admin_char_add(
     return RedirectResponse(url="/profile/admin/profiles", status_code=303)
 
 
-@router.post("/profile/admin/char/delete")
+@router.post(
+    "/profile/admin/char/delete",
+    dependencies=[Depends(utils.admin.RequireAccess("edit_chars"))],
+)
 async def profile_admin_char_delete(
     request: Request,
     uuid: str = Form(...),
-    index: int = Form(...),
+    char_id: int = Form(...),
 ):
-    utils.admin.require_access(request, "edit_chars")
-
-    target = ProfileDataBase.get_profile_by_uuid(uuid)
-    if not target:
-        utils.error.not_found(
-            "profile_utils.error.not_found", "Profile not found", uuid=uuid
-        )
-
-    data = target.get("data", ProfileData())  # type: ignore
-    if not isinstance(data, ProfileData):
-        utils.error.server_error(
-            "profile_data_invalid", "Profile data has invalid type", uuid=uuid
-        )
-
-    if index < 0 or index >= len(data.chars):
-        utils.error.bad_request(
-            "char_index_invalid", "Invalid character index", uuid=uuid, index=index
-        )
-
-    data.chars.pop(index)
-    total_mb = round(sum(c.get("weight_mb", 0) for c in data.chars), 2)
-    data.limits["used"] = total_mb
-
     try:
-        ProfileDataBase.update_profile(uuid, data=data)
+        deleted = ProfileDataBase.delete_char(uuid, char_id)
 
     except Exception as e:
         logger.exception("delete_profile_char failed: %s", e)
@@ -389,17 +377,23 @@ async def profile_admin_char_delete(
             "profile_update_failed", "Failed to delete character", uuid=uuid
         )
 
+    if not deleted:
+        utils.error.not_found(
+            "char_not_found", "Character not found", uuid=uuid, char_id=char_id
+        )
+
     return RedirectResponse(url="/profile/admin/profiles", status_code=303)
 
 
-@router.post("/profile/admin/profile/create")
+@router.post(
+    "/profile/admin/profile/create",
+    dependencies=[Depends(utils.admin.RequireAccess("edit_profiles"))],
+)
 async def profile_admin_create(
     request: Request,
     discord_id: str = Form(...),
     steam_input: str = Form(...),
 ):
-    utils.admin.require_access(request, "edit_profiles")
-
     did = (discord_id or "").strip()
     if not did.isdigit():
         utils.error.bad_request(
@@ -407,7 +401,7 @@ async def profile_admin_create(
         )
 
     try:
-        sid64 = utils.steam.normalize_steam_input(steam_input)
+        sid64 = await utils.steam.normalize_steam_input_async(steam_input)
 
     except Exception as e:
         logger.exception("normalize_steam_input failed: %s", e)
@@ -425,30 +419,137 @@ async def profile_admin_create(
             input=steam_input,
         )
 
-    all_profiles = ProfileDataBase.get_all_profiles()
-    if any(p.get("discord_id") == did for p in all_profiles):
+    try:
+        [(_, conflict)] = await asyncio.to_thread(
+            ProfileDataBase.create_profiles, [(did, sid64)]
+        )
+
+    except Exception as e:
+        logger.exception("create_profile failed: %s", e)
+        utils.error.server_error(
+            "profile_create_failed",
+            "Failed to create profile",
+            discord_id=did,
+            steam_id=sid64,
+        )
+
+    if conflict == "discord_id":
         utils.error.bad_request(
             "discord_id_conflict", "Discord ID already exists", discord_id=did
         )
 
-    if any(p.get("steam_id") == sid64 for p in all_profiles):
+    if conflict == "steam_id":
         utils.error.bad_request(
             "steam_id_conflict", "Steam ID already exists", steam_id=sid64
         )
 
+    return RedirectResponse(url="/profile/admin/profiles", status_code=303)
+
+
+def _parse_import(raw: bytes) -> list[tuple[str, str]]:
+    """(discord_id, steam_input) pairs from a JSON array or a CSV file."""
+    text = raw.decode("utf-8-sig").strip()
+    if text.startswith("["):
+        rows = []
+        for item in json.loads(text):
+            if isinstance(item, dict):
+                steam = item.get("steam_input") or item.get("steam_id") or ""
+                rows.append((str(item.get("discord_id") or ""), str(steam)))
+
+            elif isinstance(item, list) and len(item) >= 2:
+                rows.append((str(item[0]), str(item[1])))
+
+            else:
+                rows.append(("", ""))
+
+        return rows
+
+    rows = [
+        (r[0], r[1] if len(r) > 1 else "")
+        for r in csv.reader(io.StringIO(text))
+        if r and any(c.strip() for c in r)
+    ]
+    if rows and not rows[0][0].strip().isdigit():
+        rows = rows[1:]  # header
+
+    return rows
+
+
+def _normalize_import(
+    rows: list[tuple[str, str]],
+) -> tuple[list[tuple[int, str, str]], list[dict]]:
+    ready, errors = [], []
+    for n, (discord_id, steam_input) in enumerate(rows, start=1):
+        did = discord_id.strip()
+        if not did.isdigit():
+            errors.append({"row": n, "code": "discord_id_invalid", "value": did})
+            continue
+
+        try:
+            sid64 = utils.steam.normalize_steam_input(steam_input)
+
+        except Exception as e:
+            logger.warning("normalize_steam_input failed for row %s: %s", n, e)
+            sid64 = None
+
+        if not sid64:
+            errors.append(
+                {"row": n, "code": "steam_input_unsupported", "value": steam_input}
+            )
+            continue
+
+        ready.append((n, did, sid64))
+
+    return ready, errors
+
+
+@router.post(
+    "/profile/admin/profile/import",
+    dependencies=[Depends(utils.admin.RequireAccess("edit_profiles"))],
+)
+async def profile_admin_import(file: UploadFile = File(...)):
+    try:
+        rows = _parse_import(await file.read())
+
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        utils.error.bad_request(
+            "import_invalid", "Failed to parse import file", error=str(e)
+        )
+
+    if len(rows) > MAX_IMPORT_ROWS:
+        utils.error.bad_request(
+            "import_too_large", "Too many rows", rows=len(rows), max=MAX_IMPORT_ROWS
+        )
+
+    # Vanity names may need a Steam API call, keep them off the event loop
+    ready, errors = await asyncio.to_thread(_normalize_import, rows)
+
     try:
-        ProfileDataBase.create_profile(discord_id=did, steam_id=sid64)
+        # Inserts and FTS updates run under the profiles write lock
+        results = await asyncio.to_thread(
+            ProfileDataBase.create_profiles, [(d, s) for _, d, s in ready]
+        )
 
     except Exception as e:
-        logger.exception("create_profile failed: %s", e)
-        utils.error.server_error(
-            "profile_create_failed",
-            "Failed to create profile",
-            discord_id=did,
-            steam_id=sid64,
+        logger.exception("create_profiles failed: %s", e)
+        utils.error.server_error("profile_import_failed", "Failed to import profiles")
+
+    created = 0
+    for (n, did, sid64), (p_uuid, conflict) in zip(ready, results):
+        if p_uuid:
+            created += 1
+            continue
+
+        errors.append(
+            {
+                "row": n,
+                "code": f"{conflict}_conflict",
+                "value": did if conflict == "discord_id" else sid64,
+            }
         )
 
-    return RedirectResponse(url="/profile/admin/profiles", status_code=303)
+    errors.sort(key=lambda e: e["row"])
+    return {"total": len(rows), "created": created, "errors": errors}
 
 
 @router.post("/profile/admin/recalc_roles")
@@ -458,39 +559,22 @@ async def profile_admin_recalc_roles(request: Request):
     )
 
 
-@router.post("/profile/admin/recalc_weights")
+@router.post(
+    "/profile/admin/recalc_weights",
+    dependencies=[Depends(utils.admin.RequireAccess("edit_chars"))],
+)
 async def profile_admin_recalc_weights(request: Request):
-    utils.admin.require_access(request, "edit_chars")
-
-    profiles = ProfileDataBase.get_all_profiles()
-
-    async def process_profile(p: dict):
-        data = p.get("data", ProfileData())
-        if not isinstance(data, ProfileData):
-            logger.warning("Skip profile with invalid data type: %s", p.get("uuid"))
-            return
-
-        chars = data.chars
-        total_bytes = 0
-        for ch in chars:
-            ids: list[str] = []
-            for url in ch.get("steam_urls", []):
-                m = re.search(r"[?&]id=(\d+)", url)
-                if m:
-                    ids.append(m.group(1))
-
-            if not ids:
-                ch["weight_mb"] = 0
-                continue
-
-            sizes = utils.steam.fetch_workshop_sizes(ids)
-            ch_weight = sum(sizes.values())
-            ch["weight_mb"] = round(ch_weight / 1024 / 1024, 2)
-            total_bytes += ch_weight
-
-        data.chars = chars
-        data.limits["used"] = round(total_bytes / 1024 / 1024, 2)
-        ProfileDataBase.update_profile(p["uuid"], data=data)
-
-    await asyncio.gather(*(process_profile(p) for p in profiles))
+    if not utils.workshop.WeightRecalc.start():
+        utils.error.bad_request(
+            "recalc_running", "Weight recalculation is already running"
+        )
+
     return RedirectResponse(url="/profile/admin/profiles", status_code=303)
+
+
+@router.get(
+    "/profile/admin/recalc_weights/status",
+    dependencies=[Depends(utils.admin.RequireAccess("edit_chars"))],
+)
+async def profile_admin_recalc_weights_status():
+    return utils.workshop.WeightRecalc.status()
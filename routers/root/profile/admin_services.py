@@ -2,7 +2,7 @@ import logging
 import uuid
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Form, Request
+from fastapi import APIRouter, Depends, Form, Request
 from fastapi.responses import RedirectResponse
 
 import utils.admin
@@ -11,13 +11,12 @@ from data_bases import PaymentServiceDB
 from data_bases import Service as ServiceModel
 from templates import templates
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(utils.admin.RequireAccess("edit_services"))])
 logger = logging.getLogger(__name__)
 
 
 @router.get("/profile/admin/services")
 async def admin_services(request: Request):
-    utils.admin.require_access(request, "edit_services")
     rows = PaymentServiceDB.list_services()
     items = []
     for u, svc in rows:
@@ -57,8 +56,6 @@ async def service_create(
     sell_time: str | None = Form(None),
     oferta_limit: bool = Form(False),
 ):
-    utils.admin.require_access(request, "edit_services")
-
     left_i = int(left) if left not in (None, "") else None
 
     payload = {
@@ -93,8 +90,6 @@ async def service_update(
     sell_time: str | None = Form(None),
     oferta_limit: bool = Form(False),
 ):
-    utils.admin.require_access(request, "edit_services")
-
     current = PaymentServiceDB.get_service(u_id)
     if not current:
         utils.error.not_found("service_not_found", "Service not found", u_id=u_id)
@@ -123,6 +118,5 @@ async def service_update(
 
 @router.post("/profile/admin/service/delete")
 async def service_delete(request: Request, u_id: str = Form(...)):
-    utils.admin.require_access(request, "edit_services")
     PaymentServiceDB.delete_service(u_id)
     return RedirectResponse("/profile/admin/services", status_code=303)
@@ -1,17 +1,22 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import RedirectResponse
 
-import utils.jwt
-from data_class import ProfileDataBase
+import utils.admin
 from templates import templates
 
 router = APIRouter()
 
 
 async def render_profile_page(request: Request, template_name: str):
-    token = request.cookies.get("session")
-    decoded = utils.jwt.decode(token) if token else None
-    if not decoded:
+    profile = utils.admin.current_profile(request)
+    if profile:
+        profile = {k: v for k, v in profile.items() if k != "notes"}
+        return templates.TemplateResponse(
+            template_name,
+            {"request": request, "authenticated": True, "profile": profile},
+        )
+
+    if not utils.admin.session_data(request):
         if template_name == "profile/index.html":
             return templates.TemplateResponse(
                 template_name,
@@ -20,23 +25,9 @@ async def render_profile_page(request: Request, template_name: str):
 
         return RedirectResponse("/profile")
 
-    uuid = decoded.get("uuid")
-    if not uuid:
-        resp = RedirectResponse("/profile")
-        resp.delete_cookie("session")
-        return resp
-
-    profile = ProfileDataBase.get_profile_by_uuid(uuid)
-    if not profile:
-        resp = RedirectResponse("/profile")
-        resp.delete_cookie("session")
-        return resp
-
-    profile.pop("notes", None)
-    return templates.TemplateResponse(
-        template_name,
-        {"request": request, "authenticated": True, "profile": profile},
-    )
+    resp = RedirectResponse("/profile")
+    resp.delete_cookie("session")
+    return resp
 
 
 @router.get("/profile")
@@ -1,5 +1,19 @@
-from .admin import get_admin_profile, require_access, require_admin
+from .admin import (
+    RequireAccess,
+    SessionCache,
+    current_profile,
+    get_admin_profile,
+    load_profile,
+    require_access,
+    require_admin,
+    session_data,
+)
 from .error import bad_request, failed_dep, forbidden, not_found, server_error
 from .jwt import create, decode, merge_with_old
-from .steam import fetch_workshop_sizes, normalize_steam_input
+from .steam import (
+    fetch_workshop_sizes,
+    normalize_steam_input,
+    normalize_steam_input_async,
+)
 from .constant import Constant
+from .workshop import WeightRecalc, workshop_ids
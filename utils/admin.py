@@ -1,3 +1,7 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
 from fastapi import Request
 
 from data_class import ProfileData, ProfileDataBase
@@ -6,25 +10,201 @@ from .error import forbidden
 from .jwt import decode
 
 
-def get_admin_profile(request: Request) -> dict | None:
+class SessionCache:
+    """TTL + LRU cache of session token -> (profile, granted permissions).
+
+    Entries for a profile are dropped as soon as ProfileDataBase changes it,
+    the TTL only bounds how long a token outlives its own expiry.
+    """
+
+    TTL_SEC = 60.0
+    MAX_SIZE = 1024
+
+    _entries: "OrderedDict[str, tuple[float, str, dict | None, frozenset[str]]]" = (
+        OrderedDict()
+    )
+    _by_uuid: dict[str, set[str]] = {}
+    # Bumped by invalidate()/clear(), so a profile read that raced with a
+    # change is not cached
+    _generations: dict[str, int] = {}
+    _epoch = 0
+    _lock = Lock()
+    _hits = 0
+    _misses = 0
+
+    @classmethod
+    def get(cls, token: str) -> tuple[dict | None, frozenset[str]] | None:
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._entries.get(token)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    cls._drop(token)
+
+                cls._misses += 1
+                return None
+
+            cls._entries.move_to_end(token)
+            cls._hits += 1
+            return entry[2], entry[3]
+
+    @classmethod
+    def generation(cls, uuid: str) -> tuple[int, int]:
+        """Read before loading a profile and pass the result to put()."""
+        with cls._lock:
+            return cls._epoch, cls._generations.get(uuid, 0)
+
+    @classmethod
+    def put(
+        cls,
+        token: str,
+        uuid: str,
+        profile: dict | None,
+        perms: frozenset[str],
+        generation: tuple[int, int],
+        ttl: float | None = None,
+    ) -> None:
+        ttl = cls.TTL_SEC if ttl is None else min(ttl, cls.TTL_SEC)
+        if ttl <= 0:
+            return
+
+        with cls._lock:
+            if generation != (cls._epoch, cls._generations.get(uuid, 0)):
+                return
+
+            cls._drop(token)
+            cls._entries[token] = (time.monotonic() + ttl, uuid, profile, perms)
+            cls._by_uuid.setdefault(uuid, set()).add(token)
+
+            while len(cls._entries) > cls.MAX_SIZE:
+                cls._drop(next(iter(cls._entries)))
+
+    @classmethod
+    def _drop(cls, token: str) -> None:
+        entry = cls._entries.pop(token, None)
+        if entry is None:
+            return
+
+        tokens = cls._by_uuid.get(entry[1])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del cls._by_uuid[entry[1]]
+
+    @classmethod
+    def invalidate(cls, uuid: str) -> None:
+        with cls._lock:
+            cls._generations[uuid] = cls._generations.get(uuid, 0) + 1
+            for token in list(cls._by_uuid.get(uuid, ())):
+                cls._drop(token)
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._epoch += 1
+            cls._entries.clear()
+            cls._by_uuid.clear()
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            return {
+                "size": len(cls._entries),
+                "hits": cls._hits,
+                "misses": cls._misses,
+            }
+
+
+ProfileDataBase.on_change(SessionCache.invalidate)
+
+
+def _granted(data: ProfileData) -> frozenset[str]:
+    if data.access.get("full_access", False):
+        return frozenset(data.access) | {"*"}
+
+    return frozenset(k for k, v in data.access.items() if v)
+
+
+def session_data(request: Request) -> dict | None:
+    """Decoded session cookie, decoded at most once per request."""
+    if hasattr(request.state, "session_data"):
+        return request.state.session_data
+
     token = request.cookies.get("session")
     decoded = decode(token) if token else None
+    request.state.session_data = decoded
+    return decoded
+
+
+def load_profile(request: Request, uuid: str) -> dict | None:
+    """ProfileDataBase.get_profile_by_uuid memoized for the current request."""
+    profiles: dict[str, dict | None] = getattr(request.state, "profiles", None)
+    if profiles is None:
+        profiles = request.state.profiles = {}
+
+    if uuid not in profiles:
+        profiles[uuid] = ProfileDataBase.get_profile_by_uuid(uuid)
+
+    return profiles[uuid]
+
+
+def _load_session(request: Request) -> tuple[dict | None, frozenset[str]]:
+    if hasattr(request.state, "admin_session"):
+        return request.state.admin_session
+
+    request.state.admin_session = result = _resolve_session(request)
+    return result
+
+
+def _resolve_session(request: Request) -> tuple[dict | None, frozenset[str]]:
+    token = request.cookies.get("session")
+    if not token:
+        return None, frozenset()
+
+    cached = SessionCache.get(token)
+    if cached is not None:
+        return cached
+
+    decoded = session_data(request)
     if not decoded:
-        return None
+        return None, frozenset()
 
     uuid = decoded.get("uuid")
     if not uuid:
-        return None
+        return None, frozenset()
 
-    profile = ProfileDataBase.get_profile_by_uuid(uuid)
-    if not profile:
-        return None
+    ttl = None
+    exp = decoded.get("exp")
+    if isinstance(exp, (int, float)):
+        ttl = exp - time.time()
 
-    raw = profile.get("data", ProfileData())
+    generation = SessionCache.generation(uuid)
+    profile = ProfileDataBase.get_profile_by_uuid(uuid)
+    raw = profile.get("data") if profile else None
     if not isinstance(raw, ProfileData):
+        profile, perms = None, frozenset()
+    else:
+        perms = _granted(raw)
+
+    SessionCache.put(token, uuid, profile, perms, generation, ttl)
+    return profile, perms
+
+
+def current_profile(request: Request) -> dict | None:
+    """Profile of the logged in user, whatever their permissions."""
+    return _load_session(request)[0]
+
+
+def _has(perms: frozenset[str], perm: str) -> bool:
+    return "*" in perms or perm in perms
+
+
+def get_admin_profile(request: Request) -> dict | None:
+    profile, perms = _load_session(request)
+    if profile is None or not _has(perms, "panel_access"):
         return None
 
-    return profile if raw.has_access("panel_access") else None
+    return profile
 
 
 def require_admin(request: Request) -> dict | None:
@@ -37,18 +217,31 @@ def require_admin(request: Request) -> dict | None:
 
 
 def require_access(request: Request, perm: str) -> dict | None:
-    admin = require_admin(request)
-    if not admin:
+    profile, perms = _load_session(request)
+    if profile is None or not _has(perms, "panel_access"):
         forbidden("admin_required", "Admin privileges required to access this endpoint")
         return None
 
-    raw = admin.get("data", ProfileData())
-    if not isinstance(raw, ProfileData):
-        forbidden("admin_data_invalid", "Admin profile data is invalid")
-        return None
-
-    if not raw.has_access(perm):
+    if not _has(perms, perm):
         forbidden(f"{perm}_required", f"Permission '{perm}' is required")
         return None
 
-    return admin
+    return profile
+
+
+class RequireAccess:
+    """Dependency that resolves the admin profile and checks a permission.
+
+    `Depends(RequireAccess("edit_payments"))` on a route or router replaces an
+    explicit `require_access` call; without a permission it only requires
+    panel access.
+    """
+
+    def __init__(self, perm: str | None = None) -> None:
+        self.perm = perm
+
+    def __call__(self, request: Request) -> dict:
+        if self.perm is None:
+            return require_admin(request)  # type: ignore
+
+        return require_access(request, self.perm)  # type: ignore
@@ -1,10 +1,13 @@
+import asyncio
 import logging
 import re
-from typing import Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Optional
 
-import requests
-
-from data_control import Config
+from data_bases import VanityCacheDB, WorkshopCacheDB, WorkshopItem
+from data_control import Config, HttpClient
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +24,10 @@ _STEAM3_RE = re.compile(r"^\[?U:1:(?P<acc>\d+)\]?$", re.IGNORECASE)
 
 _PLAUSIBLE_VANITY_RE = re.compile(r"^[A-Za-z0-9._-]{2,64}$")
 
+_VANITY_NO_MATCH = 42
+_VANITY_TTL_SEC = 30 * 24 * 3600
+_VANITY_MISS_TTL_SEC = 3600
+
 
 def _steam64_from_account_id(account_id: int) -> int:
     return _STEAMID64_BASE + account_id
@@ -56,50 +63,75 @@ def _parse_digits_as_sid64_or_acc(s: str) -> Optional[int]:
     return _steam64_from_account_id(val) if val >= 1 else None
 
 
-def _resolve_vanity_via_api(vanity: str) -> Optional[int]:
+def _resolve_vanity_via_api(vanity: str) -> tuple[Optional[int], bool]:
+    """(steamid, answered): answered is False if the API could not be asked."""
     api_key = Config.steam_api()
     try:
-        r = requests.get(
+        r = HttpClient.get(
+            "steam_api",
             "https://api.steampowered.com/ISteamUser/ResolveVanityURL/v1/",
             params={"key": api_key, "vanityurl": vanity},
-            timeout=8,
         )
         r.raise_for_status()
         resp = (r.json() or {}).get("response") or {}
-        if int(resp.get("success", 0)) == 1 and resp.get("steamid"):
-            return int(resp["steamid"])
+        success = int(resp.get("success", 0))
+        if success == 1 and resp.get("steamid"):
+            return int(resp["steamid"]), True
+
+        return None, success == _VANITY_NO_MATCH
 
     except Exception as e:
         logger.warning("Steam vanity resolve via API failed for %r: %s", vanity, e)
 
-    return None
+    return None, False
 
 
-def _resolve_vanity_fallback(vanity: str) -> Optional[int]:
+def _resolve_vanity_fallback(vanity: str) -> tuple[Optional[int], bool]:
+    answered = True
     for base in ("id", "user"):
         try:
-            r = requests.get(
+            r = HttpClient.get(
+                "steam_community",
                 f"https://steamcommunity.com/{base}/{vanity}?xml=1",
-                timeout=8,
                 headers={"Accept": "application/xml,text/xml,*/*"},
             )
+            if r.status_code >= 500:
+                answered = False
+                continue
+
             if r.status_code != 200 or "<steamID64>" not in r.text:
                 continue
 
             m = re.search(r"<steamID64>(\d+)</steamID64>", r.text)
             if m:
-                return int(m.group(1))
+                return int(m.group(1)), True
 
         except Exception as e:
+            answered = False
             logger.warning(
                 "Steam vanity fallback failed (%s) for %r: %s", base, vanity, e
             )
 
-    return None
+    return None, answered
 
 
 def _resolve_vanity_to_sid64(vanity: str) -> Optional[int]:
-    return _resolve_vanity_via_api(vanity) or _resolve_vanity_fallback(vanity)
+    cached = VanityCacheDB.get(vanity)
+    if cached is not None:
+        steam_id, fetched_at = cached
+        ttl = _VANITY_TTL_SEC if steam_id else _VANITY_MISS_TTL_SEC
+        if time.time() - fetched_at < ttl:
+            return int(steam_id) if steam_id else None
+
+    sid64, answered = _resolve_vanity_via_api(vanity)
+    if not sid64 and not answered:
+        sid64, answered = _resolve_vanity_fallback(vanity)
+
+    # Only cache what Steam actually answered, not network failures
+    if sid64 or answered:
+        VanityCacheDB.put(vanity, str(sid64) if sid64 else None)
+
+    return sid64
 
 
 def normalize_steam_input(raw: str) -> Optional[str]:
@@ -135,10 +167,36 @@ def normalize_steam_input(raw: str) -> Optional[str]:
     return None
 
 
-def fetch_workshop_sizes(ids: list[str]) -> dict[str, int]:
-    if not ids:
-        return {}
+async def normalize_steam_input_async(raw: str) -> Optional[str]:
+    """normalize_steam_input with vanity lookups run off the event loop."""
+    s = (raw or "").strip()
+    sid64 = (
+        _parse_profiles_url(s)
+        or _parse_steam2(s)
+        or _parse_steam3(s)
+        or _parse_digits_as_sid64_or_acc(s)
+    )
+    if sid64:
+        return str(sid64)
+
+    return await asyncio.to_thread(normalize_steam_input, raw)
 
+
+_WORKSHOP_BATCH = 100
+_WORKSHOP_CONCURRENCY = 4
+_WORKSHOP_TTL_SEC = 6 * 3600  # fresh, served as is
+_WORKSHOP_STALE_SEC = 7 * 24 * 3600  # stale, served while refreshed
+
+_refresh_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="workshop")
+_refreshing: set[str] = set()
+_refreshing_lock = Lock()
+
+
+def _fetch_workshop_batch(ids: list[str]) -> list[WorkshopItem] | None:
+    """Items for one GetPublishedFileDetails call, None if the call failed.
+
+    Items Steam does not return (removed, hidden) are kept as 0 bytes.
+    """
     api_key = Config.steam_api()
     payload: dict[str, str] = {"itemcount": str(len(ids))}
     if api_key:
@@ -148,10 +206,10 @@ def fetch_workshop_sizes(ids: list[str]) -> dict[str, int]:
         payload[f"publishedfileids[{i}]"] = str(fid)
 
     try:
-        r = requests.post(
+        r = HttpClient.post(
+            "steam_api",
             "https://api.steampowered.com/ISteamRemoteStorage/GetPublishedFileDetails/v1/",
             data=payload,
-            timeout=8,
         )
         r.raise_for_status()
         details = ((r.json() or {}).get("response") or {}).get(
@@ -160,15 +218,128 @@ def fetch_workshop_sizes(ids: list[str]) -> dict[str, int]:
 
     except Exception as e:
         logger.warning("Workshop size fetch failed: %s", e)
-        return {}
+        return None
 
-    out: dict[str, int] = {}
+    now = time.time()
+    items = {fid: WorkshopItem(fid, 0, "", 0, now) for fid in ids}
     for it in details:
-        if it.get("result") == 1 and it.get("publishedfileid"):
-            try:
-                out[str(it["publishedfileid"])] = int(it.get("file_size", 0))
+        fid = str(it.get("publishedfileid") or "")
+        if it.get("result") != 1 or fid not in items:
+            continue
 
-            except Exception:
-                continue
+        try:
+            items[fid] = WorkshopItem(
+                publishedfileid=fid,
+                file_size=int(it.get("file_size", 0)),
+                title=str(it.get("title") or ""),
+                time_updated=int(it.get("time_updated", 0)),
+                fetched_at=now,
+            )
+
+        except Exception:
+            continue
+
+    return list(items.values())
+
+
+def _fetch_workshop_items(
+    ids: list[str],
+    progress: Callable[[int], None] | None = None,
+) -> dict[str, WorkshopItem]:
+    """Fetch from Steam in parallel batches and store in the cache table."""
+    batches = [
+        ids[i : i + _WORKSHOP_BATCH] for i in range(0, len(ids), _WORKSHOP_BATCH)
+    ]
+    if not batches:
+        return {}
+
+    out: dict[str, WorkshopItem] = {}
+    with ThreadPoolExecutor(
+        max_workers=min(_WORKSHOP_CONCURRENCY, len(batches))
+    ) as pool:
+        for batch, items in zip(batches, pool.map(_fetch_workshop_batch, batches)):
+            if items is not None:
+                WorkshopCacheDB.upsert_many(items)
+                out.update((it.publishedfileid, it) for it in items)
+
+            if progress:
+                progress(len(batch))
+
+    return out
+
+
+def _refresh_in_background(ids: list[str]) -> None:
+    with _refreshing_lock:
+        ids = [fid for fid in ids if fid not in _refreshing]
+        _refreshing.update(ids)
 
+    if not ids:
+        return
+
+    def run() -> None:
+        try:
+            _fetch_workshop_items(ids)
+
+        except Exception as e:
+            logger.warning("Workshop background refresh failed: %s", e)
+
+        finally:
+            with _refreshing_lock:
+                _refreshing.difference_update(ids)
+
+    _refresh_pool.submit(run)
+
+
+def get_workshop_items(
+    ids: list[str],
+    allow_stale: bool = True,
+    progress: Callable[[int], None] | None = None,
+) -> dict[str, WorkshopItem]:
+    """Workshop items by id, from the cache table where possible.
+
+    Entries younger than `_WORKSHOP_TTL_SEC` are used as is. Older ones up to
+    `_WORKSHOP_STALE_SEC` are returned right away and refreshed in the
+    background, unless `allow_stale` is False. Everything else is fetched
+    from Steam before returning. Ids Steam failed to answer for are left out.
+    `progress(n)` is called as n more ids resolve.
+    """
+    unique = list(dict.fromkeys(str(i) for i in ids))
+    if not unique:
+        return {}
+
+    now = time.time()
+    cached = WorkshopCacheDB.get_many(unique)
+    out: dict[str, WorkshopItem] = {}
+    stale: list[str] = []
+    missing: list[str] = []
+    for fid in unique:
+        item = cached.get(fid)
+        age = now - item.fetched_at if item else None
+        if age is not None and age < _WORKSHOP_TTL_SEC:
+            out[fid] = item  # type: ignore
+
+        elif age is not None and allow_stale and age < _WORKSHOP_STALE_SEC:
+            out[fid] = item  # type: ignore
+            stale.append(fid)
+
+        else:
+            missing.append(fid)
+
+    if progress and out:
+        progress(len(out))
+
+    if stale:
+        _refresh_in_background(stale)
+
+    out.update(_fetch_workshop_items(missing, progress))
     return out
+
+
+def fetch_workshop_sizes(
+    ids: list[str],
+    allow_stale: bool = True,
+    progress: Callable[[int], None] | None = None,
+) -> dict[str, int]:
+    """Sizes in bytes of workshop items, see get_workshop_items."""
+    items = get_workshop_items(ids, allow_stale=allow_stale, progress=progress)
+    return {fid: it.file_size for fid, it in items.items()}
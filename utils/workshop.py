@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import re
+import time
+from threading import Lock
+
+from data_class import ProfileDataBase
+
+from .steam import fetch_workshop_sizes
+
+logger = logging.getLogger(__name__)
+
+_WORKSHOP_ID_RE = re.compile(r"[?&]id=(\d+)")
+
+
+def workshop_ids(urls: list[str]) -> list[str]:
+    ids = []
+    for url in urls:
+        m = _WORKSHOP_ID_RE.search(url)
+        if m:
+            ids.append(m.group(1))
+
+    return ids
+
+
+class WeightRecalc:
+    """Background recalculation of every character's workshop weight.
+
+    All workshop ids are collected and deduplicated first, so each item is
+    asked from Steam at most once per run, and the weights are written in a
+    single transaction at the end.
+    """
+
+    _lock = Lock()
+    _task: asyncio.Task | None = None
+    _state: dict = {"status": "idle"}
+
+    @classmethod
+    def status(cls) -> dict:
+        with cls._lock:
+            return dict(cls._state)
+
+    @classmethod
+    def _update(cls, **values) -> None:
+        with cls._lock:
+            cls._state.update(values)
+
+    @classmethod
+    def _advance(cls, n: int) -> None:
+        with cls._lock:
+            cls._state["ids_done"] = cls._state.get("ids_done", 0) + n
+
+    @classmethod
+    def start(cls) -> bool:
+        """Start a run unless one is in progress; must be called on the loop."""
+        if cls._task is not None and not cls._task.done():
+            return False
+
+        with cls._lock:
+            cls._state = {"status": "running", "started_at": time.time()}
+
+        cls._task = asyncio.create_task(asyncio.to_thread(cls._run))
+        return True
+
+    @classmethod
+    def _run(cls) -> None:
+        t0 = time.perf_counter()
+        try:
+            chars = ProfileDataBase.list_all_chars()
+            ids = {
+                fid
+                for cs in chars.values()
+                for c in cs
+                for fid in workshop_ids(c.get("steam_urls", []))
+            }
+            cls._update(profiles=len(chars), ids_total=len(ids), ids_done=0)
+
+            sizes = fetch_workshop_sizes(
+                sorted(ids), allow_stale=False, progress=cls._advance
+            )
+
+            weights: dict[str, dict[int, float]] = {}
+            skipped = 0
+            for uuid, profile_chars in chars.items():
+                for ch in profile_chars:
+                    char_ids = workshop_ids(ch.get("steam_urls", []))
+                    if any(fid not in sizes for fid in char_ids):
+                        skipped += 1  # Steam did not answer, keep the old weight
+                        continue
+
+                    total = sum(sizes[fid] for fid in char_ids)
+                    weights.setdefault(uuid, {})[ch["id"]] = round(
+                        total / 1024 / 1024, 2
+                    )
+
+            ProfileDataBase.set_char_weights_many(weights)
+            cls._update(
+                status="done",
+                chars_updated=sum(len(w) for w in weights.values()),
+                chars_skipped=skipped,
+                finished_at=time.time(),
+                duration_sec=round(time.perf_counter() - t0, 2),
+            )
+            logger.info("Workshop weights recalculated: %s", cls.status())
+
+        except Exception as e:
+            logger.exception("Workshop weight recalculation failed: %s", e)
+            cls._update(status="failed", error=str(e), finished_at=time.time())